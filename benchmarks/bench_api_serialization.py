@@ -0,0 +1,76 @@
+# benchmarks/bench_api_serialization.py
+"""
+Micro-benchmark de la serialización de get_inventory_api.
+
+Compara, sobre N items en formato de DynamoDB (100k por defecto), lo que
+cuesta pasar de la respuesta de Scan/Query al JSON de la API:
+- antes: recurso de boto3 (TypeDeserializer -> Decimal) + json.dumps con DecimalEncoder
+- después: cliente de bajo nivel + item_to_json + json.dumps
+
+Mide tiempo y pico de memoria (tracemalloc) de cada camino.
+
+Uso (desde la raíz del proyecto, con boto3 instalado):
+    python benchmarks/bench_api_serialization.py [num_items]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from boto3.dynamodb.types import TypeDeserializer
+
+# lambda_function crea los clientes de AWS al importarse: solo necesita una región
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+LAMBDAS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas')
+sys.path.insert(0, os.path.join(LAMBDAS_DIR, 'shared')) # módulos comunes (sharding)
+sys.path.insert(0, os.path.join(LAMBDAS_DIR, 'get_inventory_api'))
+
+from lambda_function import DecimalEncoder, item_to_json
+
+
+def build_items(num_items):
+    """Items sintéticos tal como los devuelve el cliente de bajo nivel."""
+    return [
+        {
+            'Store': {'S': f"Store-{i % 300}"},
+            'Item': {'S': f"Item {i}"},
+            'Count': {'N': str(i % 50)},
+        }
+        for i in range(num_items)
+    ]
+
+
+def bench_resource(raw_items):
+    deserializer = TypeDeserializer()
+    items = [{k: deserializer.deserialize(v) for k, v in item.items()} for item in raw_items]
+    return json.dumps(items, cls=DecimalEncoder)
+
+
+def bench_client(raw_items):
+    return json.dumps([item_to_json(item) for item in raw_items])
+
+
+def run(name, func, raw_items):
+    tracemalloc.start()
+    start = time.perf_counter()
+    body = func(raw_items)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<44} {elapsed:7.3f}s  pico {peak / 1024 / 1024:7.1f} MB  {len(raw_items) / elapsed:>12,.0f} items/s")
+    return elapsed, body
+
+
+def main():
+    num_items = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    raw_items = build_items(num_items)
+    print(f"{num_items} items sintéticos")
+    before, body_before = run("antes: recurso (Decimal) + DecimalEncoder", bench_resource, raw_items)
+    after, body_after = run("después: cliente + item_to_json", bench_client, raw_items)
+    assert json.loads(body_before) == json.loads(body_after), "Los dos caminos deben dar el mismo JSON"
+    print(f"Mejora: x{before / after:.2f}")
+
+
+if __name__ == '__main__':
+    main()
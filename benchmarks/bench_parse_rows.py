@@ -0,0 +1,98 @@
+# benchmarks/bench_parse_rows.py
+"""
+Micro-benchmark del parseo de filas de load_inventory.
+
+Compara, sobre un CSV sintético en memoria (1M filas por defecto):
+- antes: csv.DictReader + parse_csv_row (normaliza las cabeceras en cada fila;
+  es el parseo original de load_inventory, copiado aquí como referencia)
+- después: csv.reader + RowMapper (cabeceras resueltas una vez por fichero)
+
+Uso (desde la raíz del proyecto, con boto3 instalado):
+    python benchmarks/bench_parse_rows.py [num_filas]
+"""
+import csv
+import io
+import os
+import sys
+import time
+
+# lambda_function crea el recurso de DynamoDB al importarse: solo necesita una región
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+LAMBDAS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas')
+sys.path.insert(0, os.path.join(LAMBDAS_DIR, 'shared')) # módulos comunes (sharding)
+sys.path.insert(0, os.path.join(LAMBDAS_DIR, 'load_inventory'))
+
+from lambda_function import RowMapper
+
+
+def parse_csv_row(row):
+    """
+    Normaliza las cabeceras del CSV (Store, Item, Count)
+    independientemente de mayúsculas/minúsculas o idioma.
+    """
+    cleaned = { (k or "").strip().lower(): v.strip() for k, v in row.items() }
+
+    store = cleaned.get("store") or cleaned.get("tienda")
+    item = cleaned.get("item") or cleaned.get("articulo")
+
+    count_str = cleaned.get("count") or cleaned.get("cantidad") or "0"
+    try:
+        count = int(count_str)
+    except ValueError:
+        count = 0
+
+    if not store or not item:
+        return None
+
+    return {
+        "Store": store,
+        "Item": item,
+        "Count": count
+    }
+
+
+def build_csv(num_rows):
+    """Genera un CSV de inventario sintético (varias tiendas y artículos)."""
+    lines = ["Store,Item,Count"]
+    for i in range(num_rows):
+        lines.append(f"Store-{i % 300},Item {i},{i % 50}")
+    return "\n".join(lines) + "\n"
+
+
+def bench_dictreader(text):
+    parsed = 0
+    for row in csv.DictReader(io.StringIO(text)):
+        if parse_csv_row(row):
+            parsed += 1
+    return parsed
+
+
+def bench_row_mapper(text):
+    parsed = 0
+    reader = csv.reader(io.StringIO(text))
+    mapper = RowMapper(next(reader))
+    for row in reader:
+        if mapper(row):
+            parsed += 1
+    return parsed
+
+
+def run(name, func, text, num_rows):
+    start = time.perf_counter()
+    parsed = func(text)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {parsed:>9} filas  {elapsed:7.2f}s  {num_rows / elapsed:>12,.0f} filas/s")
+    return elapsed
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    text = build_csv(num_rows)
+    print(f"CSV sintético: {num_rows} filas, {len(text) / 1024 / 1024:.1f} MB")
+    before = run("antes: DictReader + parse_csv_row", bench_dictreader, text, num_rows)
+    after = run("después: csv.reader + RowMapper", bench_row_mapper, text, num_rows)
+    print(f"Mejora: x{before / after:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# infra/bulk_import.py
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+from boto3.dynamodb.types import TypeSerializer
+
+# Configuración básica de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Filas por fichero de importación (cada parte es un .json.gz en S3)
+IMPORT_PART_ROWS = int(os.environ.get('IMPORT_PART_ROWS', 1_000_000))
+CSV_SUFFIXES = ('.csv', '.csv.gz')
+
+def load_loader_module():
+    """
+    Importa lambdas/load_inventory/lambda_function.py para reutilizar la
+    normalización de la carga normal (RowMapper, duplicados, LowStock,
+    UpdatedAt y claves repartidas). Lee la misma configuración del entorno
+    (LOW_STOCK_THRESHOLD, SHARDED_STORES, UPDATED_BUCKET_SECONDS).
+    """
+    os.environ.setdefault('AWS_DEFAULT_REGION', os.environ.get('AWS_REGION', 'us-east-1'))
+    lambdas_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas')
+    # lambdas/shared: módulos comunes que package_lambda.py copia en cada .zip
+    for path in (os.path.join(lambdas_dir, 'shared'), os.path.join(lambdas_dir, 'load_inventory')):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import lambda_function
+    return lambda_function
+
+def parse_s3_uri(uri):
+    """'s3://bucket/prefijo/' -> ('bucket', 'prefijo/')."""
+    if not uri.startswith('s3://'):
+        raise ValueError(f"Se esperaba una URI s3://bucket/prefijo, no '{uri}'")
+    bucket, _, prefix = uri[len('s3://'):].partition('/')
+    return bucket, prefix
+
+class ImportPartWriter:
+    """
+    Escribe los items en formato de importación de DynamoDB (DYNAMODB_JSON:
+    una línea {"Item": {...}} por item), en partes .json.gz de
+    IMPORT_PART_ROWS filas que se suben a s3://bucket/prefijo.
+    """
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.serializer = TypeSerializer()
+        self.parts = 0
+        self.rows = 0
+        self._open_part()
+
+    def _open_part(self):
+        self._buffer = io.BytesIO()
+        self._gzip = gzip.GzipFile(fileobj=self._buffer, mode='wb')
+        self._part_rows = 0
+
+    def write(self, item):
+        line = {'Item': {name: self.serializer.serialize(value) for name, value in item.items()}}
+        self._gzip.write((json.dumps(line, separators=(',', ':')) + '\n').encode('utf-8'))
+        self._part_rows += 1
+        self.rows += 1
+        if self._part_rows >= IMPORT_PART_ROWS:
+            self._upload_part()
+            self._open_part()
+
+    def _upload_part(self):
+        self._gzip.close()
+        key = f"{self.prefix}part-{self.parts:05d}.json.gz"
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=self._buffer.getvalue())
+        self.parts += 1
+        logger.info(f"Parte subida: s3://{self.bucket}/{key} ({self._part_rows} filas)")
+
+    def close(self):
+        if self._part_rows:
+            self._upload_part()
+
+def read_csv_rows(s3_client, bucket, key):
+    """Filas (listas de valores) de un CSV o CSV.gz en S3, leído en streaming."""
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    raw = gzip.GzipFile(fileobj=body) if key.endswith('.gz') else body
+    return csv.reader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+
+def convert_csvs(s3_client, source_uri, dest_bucket, dest_prefix, duplicate_policy=None):
+    """
+    Convierte los CSV de 'source_uri' al formato de ImportTable, con las
+    mismas reglas que load_inventory (cabeceras, filas repetidas, LowStock,
+    UpdatedAt y Store#n). Los ficheros de deltas no valen para una carga
+    inicial. Devuelve {'files', 'rows', 'parts', 'duplicates'}.
+    """
+    loader = load_loader_module()
+    source_bucket, source_prefix = parse_s3_uri(source_uri)
+    writer = ImportPartWriter(s3_client, dest_bucket, dest_prefix)
+
+    def emit(item):
+        writer.write(loader.stamp_updated(loader.shard_item(loader.mark_low_stock(item))))
+
+    aggregator = loader.KeyAggregator(emit, policy=duplicate_policy)
+    files = 0
+    for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=source_bucket, Prefix=source_prefix):
+        for obj in page.get('Contents', []):
+            if not obj['Key'].lower().endswith(CSV_SUFFIXES):
+                continue
+            rows = read_csv_rows(s3_client, source_bucket, obj['Key'])
+            mapper = loader.RowMapper(next(rows, []))
+            if mapper.is_delta:
+                raise ValueError(f"s3://{source_bucket}/{obj['Key']} es un fichero de deltas; la carga inicial necesita Count")
+            for row in rows:
+                item = mapper(row)
+                if item:
+                    aggregator.add(item)
+            files += 1
+            logger.info(f"Convertido: s3://{source_bucket}/{obj['Key']}")
+    aggregator.flush()
+    writer.close()
+
+    if not writer.rows:
+        raise ValueError(f"No se encontraron filas en los CSV de {source_uri}")
+    return {'files': files, 'rows': writer.rows, 'parts': writer.parts, 'duplicates': aggregator.duplicates}
@@ -1,78 +1,1367 @@
-# lambdas/get_inventory_api/lambda_function.py
-import os
-import json
-import boto3
-from decimal import Decimal
-
-dynamodb = boto3.resource('dynamodb')
-TABLE_NAME = os.environ.get('DYNAMO_TABLE_NAME', 'Inventory')
-table = dynamodb.Table(TABLE_NAME)
-
-class DecimalEncoder(json.JSONEncoder):
-    """Clase helper para convertir Decimal de DynamoDB a float/int para JSON."""
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            if obj % 1 == 0:
-                return int(obj)
-            else:
-                return float(obj)
-        return super(DecimalEncoder, self).default(obj)
-
-def make_response(status_code, body):
-    """Crea una respuesta HTTP para API Gateway con CORS."""
-    return {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",  # Habilita CORS
-            "Access-Control-Allow-Methods": "GET,OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type"
-        },
-        "body": json.dumps(body, cls=DecimalEncoder)
-    }
-
-def lambda_handler(event, context):
-    """
-    Handler principal de la Lambda.
-    Rutas:
-    - GET /items        -> Escanea toda la tabla
-    - GET /items/{store} -> Hace Query por 'Store'
-    """
-    print("Evento de API Gateway recibido:", event)
-    
-    # API Gateway HTTP API (payload v2.0)
-    raw_path = event.get('rawPath', '/')
-    path_parameters = event.get('pathParameters', {})
-    store = path_parameters.get('store')
-
-    try:
-        if raw_path == '/items' and not store:
-            # Ruta: GET /items
-            # Escanea toda la tabla (Scan).
-            # Nota: Scan es ineficiente para tablas grandes.
-            # Para esta práctica es aceptable.
-            response = table.scan()
-            items = response.get('Items', [])
-            
-            # Manejar paginación si la tabla es grande
-            while 'LastEvaluatedKey' in response:
-                response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-                items.extend(response.get('Items', []))
-                
-            return make_response(200, items)
-
-        elif store:
-            # Ruta: GET /items/{store}
-            # Usa Query (eficiente) para buscar por la Partition Key (Store).
-            response = table.query(
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('Store').eq(store)
-            )
-            items = response.get('Items', [])
-            return make_response(200, items)
-
-        else:
-            return make_response(404, {"error": "Ruta no encontrada"})
-
-    except Exception as e:
-        print(f"Error al consultar DynamoDB: {e}")
-        return make_response(500, {"error": f"Error interno del servidor: {str(e)}"})
\ No newline at end of file
+# lambdas/get_inventory_api/lambda_function.py
+import os
+import json
+import re
+import base64
+import binascii
+import csv
+import gzip
+import io
+import math
+import queue
+import random
+import threading
+import time
+import uuid
+import zlib
+import boto3
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+# Tiendas con la clave repartida (módulo común de lambdas/shared): GET
+# /items/{store} consulta todas las particiones en paralelo y mezcla por
+# Item; en las respuestas Store siempre es la tienda lógica.
+from sharding import SHARDED_STORES, shard_key, store_partitions, logical_store
+
+# Dependencia opcional (no viene en el runtime de Lambda: se añade con una
+# capa). Sin ella solo se comprime con gzip.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+dynamodb = boto3.resource('dynamodb')
+# Las lecturas del inventario usan el cliente de bajo nivel: el recurso
+# convierte cada número en Decimal y luego DecimalEncoder los vuelve a
+# convertir. Con el cliente se pasa del formato {"S": ...}/{"N": ...} a
+# tipos JSON en una sola pasada (ver item_to_json).
+dynamodb_client = boto3.client('dynamodb')
+TABLE_NAME = os.environ.get('DYNAMO_TABLE_NAME', 'Inventory')
+STATE_TABLE_NAME = os.environ.get('STATE_TABLE_NAME', 'InventoryState')
+# Totales por tienda (GET /stores y GET /stores/{store}/summary), que mantiene
+# update_aggregates desde el stream de la tabla de inventario
+AGGREGATES_TABLE_NAME = os.environ.get('AGGREGATES_TABLE_NAME', 'InventoryAggregates')
+AGGREGATE_KEY_ATTRIBUTES = ('Store',)
+state_table = dynamodb.Table(STATE_TABLE_NAME)
+s3_client = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+
+# Paginación: tamaño de página por defecto y máximo (parámetro ?limit=)
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+KEY_ATTRIBUTES = ('Store', 'Item')
+
+# Filtros en servidor: ?fields= (ProjectionExpression), ?min_count=/?max_count=
+# (FilterExpression) y ?low_stock=true, que lee el índice disperso de bajo
+# stock (solo contiene los items con Count < umbral; clave LowStock = Store)
+LOW_STOCK_INDEX = os.environ.get('LOW_STOCK_INDEX', 'LowStockIndex')
+LOW_STOCK_ATTRIBUTE = 'LowStock'
+# Búsqueda de un producto en todas las tiendas (GET /products/{item}):
+# GSI con clave Item y orden por Count (KEYS_ONLY: Item, Count y Store)
+ITEM_INDEX = os.environ.get('ITEM_INDEX', 'ItemIndex')
+# Cambios recientes (GET /items?since=): índice UpdatedIndex con clave
+# UpdatedBucket (tramo de UPDATED_BUCKET_SECONDS, igual que en load_inventory)
+# y orden por UpdatedAt. Solo se consultan los tramos desde 'since' hasta ahora.
+UPDATED_INDEX = os.environ.get('UPDATED_INDEX', 'UpdatedIndex')
+UPDATED_BUCKET_SECONDS = int(os.environ.get('UPDATED_BUCKET_SECONDS', '3600'))
+SINCE_MAX_SECONDS = int(os.environ.get('SINCE_MAX_SECONDS', str(7 * 24 * 3600)))
+UPDATED_KEY_ATTRIBUTES = KEY_ATTRIBUTES + ('UpdatedBucket', 'UpdatedAt')
+# Tipo de DynamoDB de cada atributo que puede aparecer en un cursor
+CURSOR_ATTRIBUTE_TYPES = {
+    'Store': 'S', 'Item': 'S', LOW_STOCK_ATTRIBUTE: 'S', 'Count': 'N',
+    'UpdatedBucket': 'S', 'UpdatedAt': 'N'
+}
+FIELD_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,63}$')
+MAX_FIELDS = 20
+
+# Consultas por clave: POST /items/batch reparte las claves en BatchGetItem
+# de 100 (límite de DynamoDB) que se lanzan en paralelo
+BATCH_GET_SIZE = 100
+BATCH_GET_MAX_KEYS = int(os.environ.get('BATCH_GET_MAX_KEYS', '500'))
+BATCH_GET_CONCURRENCY = int(os.environ.get('BATCH_GET_CONCURRENCY', '5'))
+BATCH_GET_MAX_RETRIES = 8
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 2.0
+
+# Exportación completa (?export=all): Scan paralelo por segmentos.
+# Un segmento por cada EXPORT_SEGMENT_BYTES de tabla (según DescribeTable),
+# entre 1 y EXPORT_MAX_SEGMENTS.
+EXPORT_SEGMENT_BYTES = int(os.environ.get('EXPORT_SEGMENT_BYTES', str(1024 * 1024)))
+EXPORT_MAX_SEGMENTS = int(os.environ.get('EXPORT_MAX_SEGMENTS', '16'))
+# Límite de la respuesta de Lambda (6 MB) con margen para cabeceras
+EXPORT_MAX_BODY_BYTES = int(os.environ.get('EXPORT_MAX_BODY_BYTES', str(5 * 1024 * 1024)))
+# Exportación en streaming (GET /items/export): se escribe en S3 por partes
+# (multipart upload) a medida que llegan las páginas del Scan, y el cliente
+# recibe una URL prefirmada. El runtime de Python de Lambda no admite
+# response streaming, así que este es el camino para exportaciones grandes.
+EXPORT_PREFIX = 'exports/'
+EXPORT_PART_BYTES = int(os.environ.get('EXPORT_PART_BYTES', str(8 * 1024 * 1024))) # mínimo de S3: 5 MB
+EXPORT_URL_EXPIRES = int(os.environ.get('EXPORT_URL_EXPIRES', '900'))
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_CSV_COLUMNS = ('Store', 'Item', 'Count')
+# La exportación no cabe en los 30 s de API Gateway: GET /items/export crea
+# un trabajo (export#<id> en la tabla de estado), se invoca a sí misma en
+# asíncrono ({"export_job": ...}) y responde 202; GET /items/export/{job}
+# dice cómo va y, al terminar, redirige a la URL prefirmada.
+EXPORT_JOB_PREFIX = 'export#'
+EXPORT_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+# Lo que puede durar un trabajo (el timeout de la Lambda): si sigue RUNNING
+# pasado ese tiempo, la invocación murió sin marcarlo y se da por fallido
+EXPORT_JOB_MAX_SECONDS = int(os.environ.get('EXPORT_JOB_MAX_SECONDS', '900'))
+EXPORT_JOB_TTL_SECONDS = 24 * 3600 # lo mismo que duran los ficheros de exports/
+EXPORT_RETRY_AFTER_SECONDS = 5
+# DynamoDB actualiza TableSizeBytes cada ~6 h: no hace falta preguntar en cada petición
+TABLE_SIZE_CACHE_SECONDS = 300
+
+_table_size = {'bytes': None, 'expires': 0.0}
+
+# Caché de respuestas en el contenedor (se conserva entre invocaciones en
+# caliente). Se invalida cuando load_inventory incrementa la versión del
+# inventario en la tabla de estado, y como mucho dura CACHE_TTL_SECONDS.
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '128'))
+# Tope de memoria de los cuerpos cacheados (una exportación puede ocupar MBs)
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', '60'))
+INVENTORY_VERSION_KEY = 'inventory#version'
+
+# Snapshots que publica load_inventory tras cada carga (?view=snapshot).
+# El item snapshot#all (o snapshot#store#<tienda>) de la tabla de estado
+# apunta a la generación publicada: su prefijo en S3, su ETag y sus páginas.
+# Deben coincidir con las claves de load_inventory.
+SNAPSHOT_BUCKET = os.environ.get('SNAPSHOT_BUCKET', '')
+SNAPSHOT_POINTER_PREFIX = 'snapshot#'
+# Un snapshot que no cabe en la respuesta (EXPORT_MAX_BODY_BYTES, en base64
+# si va comprimido) se sirve con un 303 a una URL prefirmada del objeto.
+# Con ?limit= se sirve por páginas: cada respuesta lee una sola página
+# (part-<n>.json.gz) y no pasa de su final.
+
+# Compresión de respuestas según Accept-Encoding: por debajo de este tamaño
+# no compensa (cabeceras + base64 pesan más que lo que se ahorra)
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5 # rápido y aun así mejor ratio que gzip en JSON
+
+class DecimalEncoder(json.JSONEncoder):
+    """Clase helper para convertir Decimal de DynamoDB a float/int para JSON."""
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            if obj % 1 == 0:
+                return int(obj)
+            else:
+                return float(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+def parse_number(value):
+    """Número de DynamoDB (texto) -> int o float, como DecimalEncoder."""
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        return int(number) if number.is_integer() else number
+
+def attribute_to_json(value):
+    """Convierte un atributo en formato de DynamoDB ({"S": ...}) a tipos JSON."""
+    (kind, raw), = value.items()
+    if kind == 'S' or kind == 'BOOL':
+        return raw
+    if kind == 'N':
+        return parse_number(raw)
+    if kind == 'NULL':
+        return None
+    if kind == 'M':
+        return {k: attribute_to_json(v) for k, v in raw.items()}
+    if kind == 'L':
+        return [attribute_to_json(v) for v in raw]
+    if kind == 'SS':
+        return list(raw)
+    if kind == 'NS':
+        return [parse_number(v) for v in raw]
+    if kind == 'B':
+        return base64.b64encode(raw).decode('ascii')
+    if kind == 'BS':
+        return [base64.b64encode(v).decode('ascii') for v in raw]
+    raise ValueError(f"Tipo de DynamoDB no soportado: {kind}")
+
+def item_to_json(raw_item):
+    """
+    Convierte un item del cliente de bajo nivel en un dict listo para
+    json.dumps. Store/Item/Count (el esquema conocido) van por un camino
+    directo; el resto de atributos por attribute_to_json. Store se devuelve
+    como tienda lógica (sin el sufijo de partición).
+    """
+    item = {}
+    for name, value in raw_item.items():
+        if name in KEY_ATTRIBUTES and 'S' in value:
+            item[name] = value['S']
+        elif name == 'Count' and 'N' in value:
+            item[name] = parse_number(value['N'])
+        else:
+            item[name] = attribute_to_json(value)
+    if SHARDED_STORES and 'Store' in item:
+        item['Store'] = logical_store(item['Store'])
+    return item
+
+def make_response(status_code, body, headers=None):
+    """
+    Crea una respuesta HTTP para API Gateway con CORS.
+    Si 'body' ya es un str se envía tal cual (JSON serializado por partes).
+    'headers' añade cabeceras a las comunes.
+    """
+    response_headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",  # Habilita CORS
+        "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type,If-None-Match",
+        "Access-Control-Expose-Headers": "ETag"
+    }
+    response_headers.update(headers or {})
+    return {
+        "statusCode": status_code,
+        "headers": response_headers,
+        "body": body if isinstance(body, str) else json.dumps(body, cls=DecimalEncoder)
+    }
+
+def choose_encoding(accept_encoding):
+    """
+    Negocia la compresión a partir de Accept-Encoding (con sus q=):
+    'br' si el cliente la acepta y brotli está disponible, si no 'gzip',
+    o None para enviar el cuerpo sin comprimir.
+    """
+    accepted = {}
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+    for name in ('br', 'gzip'):
+        if name == 'br' and brotli is None:
+            continue
+        if accepted.get(name, accepted.get('*', 0)) > 0:
+            return name
+    return None
+
+def compress_response(response, encoding):
+    """
+    Comprime el cuerpo de la respuesta (in situ) con 'br' o 'gzip' y lo
+    deja en base64 como espera HTTP API. No toca respuestas pequeñas ni las
+    que ya vienen codificadas (p. ej. un snapshot ya comprimido).
+    """
+    headers = response['headers']
+    headers["Vary"] = "Accept-Encoding"
+    if (not encoding or response.get('isBase64Encoded') or 'Content-Encoding' in headers
+            or len(response['body']) < COMPRESS_MIN_BYTES):
+        return response
+    raw = response['body'].encode('utf-8')
+    if encoding == 'br':
+        data = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+    response['body'] = base64.b64encode(data).decode('ascii')
+    response['isBase64Encoded'] = True
+    headers["Content-Encoding"] = encoding
+    return response
+
+def etag_matches(if_none_match, etag):
+    """Compara la cabecera If-None-Match (lista o '*') con el ETag actual."""
+    if not if_none_match or not etag:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+def not_modified(etag):
+    """Respuesta 304: el cliente ya tiene esta versión."""
+    response = make_response(304, "", headers={"ETag": etag, "Cache-Control": "no-cache"})
+    del response['headers']['Content-Type']
+    return response
+
+class ResponseCache:
+    """LRU acotado (entradas y bytes) de respuestas ya serializadas, con TTL y versión."""
+    def __init__(self, max_entries, max_bytes, ttl_seconds):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        _, _, response = self._entries.pop(key)
+        self.size_bytes -= len(response['body'])
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry_version, expires, response = entry
+            if entry_version != version or time.time() >= expires:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key, version, response):
+        size = len(response['body'])
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, time.time() + self.ttl_seconds, response)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_SECONDS)
+
+def inventory_version():
+    """
+    Lee la versión actual del inventario (un GetItem de un solo item).
+    Devuelve None si no se puede leer: en ese caso no se usa la caché.
+    """
+    try:
+        item = state_table.get_item(
+            Key={'StateKey': INVENTORY_VERSION_KEY},
+            ProjectionExpression='Version'
+        ).get('Item')
+    except Exception as e:
+        print(f"No se pudo leer la versión del inventario ({e}); se omite la caché.")
+        return None
+    return int(item['Version']) if item else 0
+
+def cache_key(raw_path, store, query_parameters, encoding=None):
+    """Clave de caché: ruta + tienda + parámetros de consulta (ordenados) + compresión."""
+    return (raw_path, store, tuple(sorted(query_parameters.items())), encoding)
+
+class BadRequest(ValueError):
+    """Parámetros de consulta inválidos (se responde 400)."""
+
+def encode_token(value):
+    """JSON -> texto opaco en base64 url-safe (sin relleno)."""
+    raw = json.dumps(value, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_token(token):
+    """Inverso de encode_token; BadRequest si el texto no es válido."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise BadRequest("Parámetro 'cursor' inválido")
+
+def encode_cursor(last_key):
+    """Convierte el LastEvaluatedKey de DynamoDB en un cursor opaco (base64 url-safe)."""
+    if not last_key:
+        return None
+    # Clave física tal cual (sin pasar Store a la tienda lógica)
+    return encode_token({name: attribute_to_json(value) for name, value in last_key.items()})
+
+def start_key(key, key_attributes):
+    """Clave en JSON (de un cursor) -> ExclusiveStartKey en formato de DynamoDB."""
+    if not isinstance(key, dict) or sorted(key) != sorted(key_attributes):
+        raise BadRequest("Parámetro 'cursor' inválido")
+    result = {}
+    for name in key_attributes:
+        value = key[name]
+        if CURSOR_ATTRIBUTE_TYPES[name] == 'N':
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise BadRequest("Parámetro 'cursor' inválido")
+            result[name] = {'N': str(value)}
+        else:
+            if not isinstance(value, str):
+                raise BadRequest("Parámetro 'cursor' inválido")
+            result[name] = {'S': value}
+    return result
+
+def decode_cursor(cursor, store=None, key_attributes=KEY_ATTRIBUTES):
+    """
+    Valida el cursor recibido y lo convierte de vuelta en ExclusiveStartKey.
+    'key_attributes' son las claves que devuelve DynamoDB en LastEvaluatedKey
+    (las de la tabla, más las del índice si se lee un GSI).
+    """
+    if not cursor:
+        return None
+    key = decode_token(cursor)
+    result = start_key(key, key_attributes)
+    if store is not None and logical_store(key['Store']) != store:
+        raise BadRequest("El cursor no corresponde a esta tienda")
+    return result
+
+def parse_limit(value):
+    """Lee ?limit= (1..MAX_PAGE_SIZE); sin valor usa DEFAULT_PAGE_SIZE."""
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise BadRequest("Parámetro 'limit' inválido")
+    if limit < 1:
+        raise BadRequest("Parámetro 'limit' inválido")
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_count(query_parameters, name):
+    """Lee ?min_count= / ?max_count= (enteros) o None si no vienen."""
+    value = query_parameters.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"Parámetro '{name}' inválido")
+
+def projection_options(fields_param, names):
+    """
+    Traduce ?fields= a ProjectionExpression. Los nombres van con alias (#f0,
+    #f1...) para no chocar con palabras reservadas como Count; se añaden a
+    'names' (ExpressionAttributeNames).
+    """
+    fields = [f.strip() for f in (fields_param or '').split(',') if f.strip()]
+    if not fields:
+        return {}
+    if len(fields) > MAX_FIELDS or not all(FIELD_NAME_RE.match(f) for f in fields):
+        raise BadRequest("Parámetro 'fields' inválido")
+    projection = []
+    for i, field in enumerate(dict.fromkeys(fields)):
+        names[f'#f{i}'] = field
+        projection.append(f'#f{i}')
+    return {'ProjectionExpression': ', '.join(projection)}
+
+def read_options(query_parameters):
+    """
+    Traduce ?fields=, ?min_count=, ?max_count= y ?low_stock= a parámetros de
+    Scan/Query. Devuelve (kwargs, atributos de clave del cursor).
+    """
+    kwargs = {}
+    names = {}
+    values = {}
+    key_attributes = KEY_ATTRIBUTES
+
+    if query_parameters.get('low_stock', '').lower() == 'true':
+        kwargs['IndexName'] = LOW_STOCK_INDEX
+        key_attributes = KEY_ATTRIBUTES + (LOW_STOCK_ATTRIBUTE,)
+
+    kwargs.update(projection_options(query_parameters.get('fields'), names))
+
+    conditions = []
+    min_count = parse_count(query_parameters, 'min_count')
+    max_count = parse_count(query_parameters, 'max_count')
+    if min_count is not None:
+        conditions.append('#count >= :min_count')
+        values[':min_count'] = {'N': str(min_count)}
+    if max_count is not None:
+        conditions.append('#count <= :max_count')
+        values[':max_count'] = {'N': str(max_count)}
+    if conditions:
+        names['#count'] = 'Count'
+        kwargs['FilterExpression'] = ' AND '.join(conditions)
+
+    if names:
+        kwargs['ExpressionAttributeNames'] = names
+    if values:
+        kwargs['ExpressionAttributeValues'] = values
+    return kwargs, key_attributes
+
+def has_filters(query_parameters):
+    """True si la petición pide filtros o proyección (no vale el snapshot)."""
+    return any(query_parameters.get(name) for name in ('fields', 'min_count', 'max_count', 'low_stock', 'since'))
+
+def read_page(operation, limit, cursor, **kwargs):
+    """
+    Lee una página de Scan/Query (cliente de bajo nivel). Devuelve
+    {'items': [...], 'next_cursor': ...}; next_cursor es None cuando no
+    quedan más elementos.
+    """
+    if cursor:
+        kwargs['ExclusiveStartKey'] = cursor
+    kwargs.setdefault('TableName', TABLE_NAME)
+    response = operation(Limit=limit, **kwargs)
+    return {
+        'items': [item_to_json(item) for item in response.get('Items', [])],
+        'next_cursor': encode_cursor(response.get('LastEvaluatedKey'))
+    }
+
+class ExportTooLarge(Exception):
+    """La exportación no cabe en una respuesta de Lambda (se responde 413)."""
+
+def table_size_bytes():
+    """Tamaño aproximado de la tabla según DescribeTable (cacheado unos minutos)."""
+    now = time.time()
+    if now >= _table_size['expires']:
+        try:
+            description = dynamodb_client.describe_table(TableName=TABLE_NAME)['Table']
+            _table_size['bytes'] = description.get('TableSizeBytes', 0)
+        except Exception as e:
+            print(f"No se pudo leer el tamaño de la tabla ({e}); se usa un solo segmento.")
+            _table_size['bytes'] = 0
+        _table_size['expires'] = now + TABLE_SIZE_CACHE_SECONDS
+    return _table_size['bytes']
+
+def export_segments():
+    """Número de segmentos del Scan paralelo según el tamaño de la tabla."""
+    segments = math.ceil(table_size_bytes() / max(1, EXPORT_SEGMENT_BYTES))
+    return max(1, min(EXPORT_MAX_SEGMENTS, segments))
+
+def scan_segment(segment, total_segments, pages, stop):
+    """
+    Recorre un segmento del Scan y deja cada página en la cola 'pages'.
+    Termina con (segment, None) para avisar de que el segmento acabó.
+    """
+    started = time.perf_counter()
+    page_count = item_count = 0
+    kwargs = {'TableName': TABLE_NAME, 'Segment': segment, 'TotalSegments': total_segments}
+    try:
+        while not stop.is_set():
+            response = dynamodb_client.scan(**kwargs)
+            items = [item_to_json(item) for item in response.get('Items', [])]
+            page_count += 1
+            item_count += len(items)
+            pages.put((segment, items))
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    finally:
+        pages.put((segment, None))
+        print(f"Segmento {segment + 1}/{total_segments}: {item_count} elementos en "
+              f"{page_count} páginas, {time.perf_counter() - started:.3f}s")
+
+def parallel_scan_pages(total_segments):
+    """
+    Scan paralelo (Segment/TotalSegments) en un pool de hilos. Genera las
+    páginas (listas de items) a medida que llegan de cualquier segmento,
+    sin esperar a que terminen los demás; la cola acotada limita la memoria.
+    """
+    pages = queue.Queue(maxsize=total_segments * 2)
+    stop = threading.Event()
+    pending = total_segments
+
+    with ThreadPoolExecutor(max_workers=total_segments) as pool:
+        futures = [pool.submit(scan_segment, segment, total_segments, pages, stop)
+                   for segment in range(total_segments)]
+        try:
+            while pending:
+                _, items = pages.get()
+                if items is None:
+                    pending -= 1
+                elif items:
+                    yield items
+        finally:
+            stop.set()
+            # Vaciar la cola para que ningún hilo se quede bloqueado en put()
+            while any(not f.done() for f in futures):
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        for future in futures:
+            future.result()  # propaga errores de DynamoDB de cualquier segmento
+
+def export_all():
+    """
+    Exporta la tabla completa en una sola respuesta JSON a partir del Scan
+    paralelo; las páginas se serializan según llegan.
+    """
+    total_segments = export_segments()
+    started = time.perf_counter()
+    chunks = []
+    body_bytes = 0
+    item_count = 0
+
+    for items in parallel_scan_pages(total_segments):
+        chunk = json.dumps(items)[1:-1]
+        body_bytes += len(chunk) + 1
+        if body_bytes > EXPORT_MAX_BODY_BYTES:
+            raise ExportTooLarge()
+        chunks.append(chunk)
+        item_count += len(items)
+
+    print(f"Exportación: {item_count} elementos, {total_segments} segmentos, "
+          f"{time.perf_counter() - started:.3f}s")
+    return '{"items": [' + ','.join(chunks) + '], "segments": ' + str(total_segments) + '}'
+
+class S3MultipartWriter:
+    """
+    Escribe un objeto de S3 por partes (multipart upload): solo guarda en
+    memoria la parte en curso. Si todo cabe en una parte usa un PutObject.
+    """
+    def __init__(self, bucket, key, content_type, part_bytes=None):
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_bytes = max(5 * 1024 * 1024, part_bytes or EXPORT_PART_BYTES)
+        self.buffer = bytearray()
+        self.parts = []
+        self.upload_id = None
+        self.size_bytes = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.size_bytes += len(data)
+        if len(self.buffer) >= self.part_bytes:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+            )['UploadId']
+        number = len(self.parts) + 1
+        etag = s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=number, Body=bytes(self.buffer)
+        )['ETag']
+        self.parts.append({'PartNumber': number, 'ETag': etag})
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.upload_id is None:
+            s3_client.put_object(
+                Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), ContentType=self.content_type
+            )
+            return
+        if self.buffer:
+            self._upload_part()
+        s3_client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+
+    def abort(self):
+        if self.upload_id is not None:
+            s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def encode_export_rows(items, fmt):
+    """Serializa una página de items como líneas NDJSON o filas CSV."""
+    if fmt == 'ndjson':
+        return ''.join(json.dumps(item, separators=(',', ':')) + '\n' for item in items).encode('utf-8')
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=EXPORT_CSV_COLUMNS, extrasaction='ignore', lineterminator='\n')
+    writer.writerows(items)
+    return out.getvalue().encode('utf-8')
+
+def export_job_key(job_id):
+    """StateKey del trabajo de exportación."""
+    return f"{EXPORT_JOB_PREFIX}{job_id}"
+
+def export_status_url(job_id):
+    return f"/items/export/{job_id}"
+
+def start_export(fmt):
+    """
+    Crea un trabajo de exportación y lanza la invocación asíncrona que lo
+    hace (run_export_job). Responde 202 con la ruta para consultar su estado.
+    """
+    if not SNAPSHOT_BUCKET:
+        raise BadRequest("La exportación no está configurada (falta SNAPSHOT_BUCKET)")
+    job_id = uuid.uuid4().hex
+    now = int(time.time())
+    key = f"{EXPORT_PREFIX}{time.strftime('%Y%m%d-%H%M%S', time.gmtime(now))}-{job_id}.{fmt}"
+    state_table.put_item(Item={
+        'StateKey': export_job_key(job_id),
+        'Status': 'RUNNING',
+        'Format': fmt,
+        'ExportKey': key,
+        'CreatedAt': now,
+        'ExpiresAt': now + EXPORT_JOB_TTL_SECONDS
+    })
+    try:
+        lambda_client.invoke(
+            FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+            InvocationType='Event',
+            Payload=json.dumps({'export_job': {'id': job_id, 'format': fmt, 'key': key}})
+        )
+    except Exception as e:
+        finish_export_job(job_id, 'FAILED', error=f"No se pudo lanzar la exportación: {e}")
+        raise
+
+    status_url = export_status_url(job_id)
+    return make_response(
+        202,
+        {"job": job_id, "status": "RUNNING", "format": fmt, "status_url": status_url},
+        headers={"Location": status_url, "Retry-After": str(EXPORT_RETRY_AFTER_SECONDS),
+                 "Cache-Control": "no-store"}
+    )
+
+def finish_export_job(job_id, status, items=None, error=None):
+    """Marca el trabajo como DONE (con el número de elementos) o FAILED."""
+    names = {'#s': 'Status'}
+    values = {':status': status, ':running': 'RUNNING', ':now': int(time.time())}
+    expression = 'SET #s = :status, FinishedAt = :now'
+    if items is not None:
+        expression += ', ItemCount = :items'
+        values[':items'] = items
+    if error is not None:
+        expression += ', #e = :error'
+        names['#e'] = 'Error'
+        values[':error'] = error[:1000]
+    state_table.update_item(
+        Key={'StateKey': export_job_key(job_id)},
+        UpdateExpression=expression,
+        ConditionExpression='#s = :running',
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
+
+def run_export_job(job):
+    """
+    Invocación asíncrona: exporta la tabla completa a S3 en NDJSON o CSV,
+    escribiendo cada página del Scan paralelo según llega (memoria
+    constante: una parte de S3 más las páginas en cola), y marca el trabajo.
+    """
+    job_id, fmt, key = job['id'], job['format'], job['key']
+    started = time.perf_counter()
+    item_count = 0
+    try:
+        total_segments = export_segments()
+        with S3MultipartWriter(SNAPSHOT_BUCKET, key, EXPORT_FORMATS[fmt]) as writer:
+            if fmt == 'csv':
+                writer.write((','.join(EXPORT_CSV_COLUMNS) + '\n').encode('utf-8'))
+            for items in parallel_scan_pages(total_segments):
+                writer.write(encode_export_rows(items, fmt))
+                item_count += len(items)
+    except Exception as e:
+        # Se marca y no se relanza: reintentar la invocación repetiría el Scan entero
+        print(f"Error en la exportación {job_id}: {e}")
+        finish_export_job(job_id, 'FAILED', error=str(e))
+        return {'statusCode': 500, 'body': json.dumps({'job': job_id, 'status': 'FAILED'})}
+
+    print(f"Exportación {job_id} ({fmt}) a s3://{SNAPSHOT_BUCKET}/{key}: {item_count} elementos, "
+          f"{writer.size_bytes} bytes, {len(writer.parts) or 1} partes, {time.perf_counter() - started:.3f}s")
+    finish_export_job(job_id, 'DONE', items=item_count)
+    return {'statusCode': 200, 'body': json.dumps({'job': job_id, 'status': 'DONE', 'items': item_count})}
+
+def export_status(job_id):
+    """
+    Estado de un trabajo de exportación: 202 mientras corre, 303 a una URL
+    prefirmada nueva cuando ha terminado, 200 con status FAILED y el error si
+    falló (la consulta sí ha ido bien) y 404 si no existe (o ya caducó).
+    """
+    job = None
+    if job_id and EXPORT_JOB_ID_RE.match(job_id):
+        job = state_table.get_item(Key={'StateKey': export_job_key(job_id)}, ConsistentRead=True).get('Item')
+    if not job:
+        return make_response(404, {"error": "Exportación no encontrada"})
+
+    status = job['Status']
+    no_store = {"Cache-Control": "no-store"}
+    if status == 'RUNNING' and time.time() - int(job['CreatedAt']) > EXPORT_JOB_MAX_SECONDS:
+        status = 'FAILED'
+        job['Error'] = "La exportación no terminó a tiempo"
+    if status == 'RUNNING':
+        return make_response(
+            202,
+            {"job": job_id, "status": status, "format": job['Format'], "status_url": export_status_url(job_id)},
+            headers=dict(no_store, **{"Retry-After": str(EXPORT_RETRY_AFTER_SECONDS)})
+        )
+    if status == 'FAILED':
+        return make_response(200, {"job": job_id, "status": status, "error": job.get('Error', '')}, headers=no_store)
+
+    url = s3_client.generate_presigned_url(
+        'get_object', Params={'Bucket': SNAPSHOT_BUCKET, 'Key': job['ExportKey']}, ExpiresIn=EXPORT_URL_EXPIRES
+    )
+    return make_response(
+        303,
+        {"job": job_id, "status": status, "url": url, "format": job['Format'],
+         "items": int(job['ItemCount']), "expires_in": EXPORT_URL_EXPIRES},
+        headers=dict(no_store, Location=url)
+    )
+
+def snapshot_pointer(store):
+    """Generación publicada del snapshot global o de una tienda (o None si no hay)."""
+    key = f"{SNAPSHOT_POINTER_PREFIX}all" if store is None else f"{SNAPSHOT_POINTER_PREFIX}store#{store}"
+    return state_table.get_item(Key={'StateKey': key}).get('Item')
+
+def snapshot_cursor(query_parameters):
+    """Cursor de una página del snapshot ({'snapshot': etag, 'offset': n}) o None si no lo es."""
+    cursor = query_parameters.get('cursor')
+    if not cursor:
+        return None
+    token = decode_token(cursor)
+    if not isinstance(token, dict) or 'snapshot' not in token:
+        return None # cursor de DynamoDB
+    offset = token.get('offset')
+    if (sorted(token) != ['offset', 'snapshot'] or not isinstance(token['snapshot'], str)
+            or isinstance(offset, bool) or not isinstance(offset, int) or offset < 0):
+        raise BadRequest("Parámetro 'cursor' inválido")
+    return token
+
+def inflate_snapshot(data, max_bytes):
+    """Descomprime el snapshot (gzip) sin pasar de max_bytes; None si no cabe."""
+    decompressor = zlib.decompressobj(31)
+    text = decompressor.decompress(data, max_bytes + 1)
+    if len(text) > max_bytes or decompressor.unconsumed_tail:
+        return None
+    return text
+
+def snapshot_redirect(key, etag):
+    """303 a una URL prefirmada del snapshot (el cliente lo descarga de S3)."""
+    url = s3_client.generate_presigned_url(
+        'get_object', Params={'Bucket': SNAPSHOT_BUCKET, 'Key': key}, ExpiresIn=EXPORT_URL_EXPIRES
+    )
+    return make_response(
+        303,
+        {"url": url, "expires_in": EXPORT_URL_EXPIRES},
+        headers={"Location": url, "ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+def snapshot_page(pointer, limit, offset):
+    """
+    Hasta ?limit= filas del snapshot desde 'offset', leyendo solo la página
+    guardada que las contiene (una respuesta no pasa del final de esa
+    página), con el ETag del snapshot y un cursor ligado a él.
+    """
+    etag = pointer['ETag']
+    total = int(pointer['ItemCount'])
+    items = []
+    generated_at = int(pointer['GeneratedAt'])
+    if offset < total:
+        page, start = divmod(offset, int(pointer['PageRows']))
+        obj = s3_client.get_object(Bucket=SNAPSHOT_BUCKET, Key=f"{pointer['Prefix']}part-{page}.json.gz")
+        document = json.loads(gzip.decompress(obj['Body'].read()))
+        items = document['items'][start:start + limit]
+    end = offset + len(items)
+    next_cursor = encode_token({'snapshot': etag, 'offset': end}) if end < total else None
+    return make_response(
+        200,
+        {"items": items, "next_cursor": next_cursor, "generated_at": generated_at},
+        headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+def serve_snapshot(store, headers, encoding=None, limit=None, cursor=None):
+    """
+    Sirve el snapshot materializado en S3 con su ETag (el de S3, fuerte),
+    también en cada página. Si el cliente ya lo tiene (If-None-Match) basta
+    leer el item que apunta a la generación publicada y se responde 304.
+    Si no cabe en la respuesta de Lambda se redirige a una URL prefirmada.
+    Con 'limit' (o un cursor de snapshot) devuelve una página del snapshot.
+    Devuelve None si no hay snapshot (todavía no se ha publicado ninguno):
+    entonces se lee DynamoDB.
+    """
+    if not SNAPSHOT_BUCKET:
+        return None
+    pointer = snapshot_pointer(store)
+    if pointer is None:
+        if cursor is not None:
+            raise BadRequest("El snapshot ya no existe; vuelve a pedir la primera página")
+        return None
+    etag = pointer['ETag']
+    if cursor is not None and cursor['snapshot'] != etag:
+        raise BadRequest("El snapshot ha cambiado; vuelve a pedir la primera página")
+    if etag_matches(headers.get('if-none-match'), etag):
+        return not_modified(etag)
+    key = f"{pointer['Prefix']}full.json.gz"
+    try:
+        if limit is not None:
+            return snapshot_page(pointer, limit, cursor['offset'] if cursor else 0)
+        obj = s3_client.get_object(Bucket=SNAPSHOT_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+        # Se acaba de publicar otra generación y esta ya se ha borrado
+        if cursor is not None:
+            raise BadRequest("El snapshot ha cambiado; vuelve a pedir la primera página")
+        return None
+
+    size = obj['ContentLength']
+    extra = {"ETag": etag, "Cache-Control": "no-cache"}
+    if encoding == 'gzip':
+        # El objeto ya está comprimido con gzip: se envía tal cual (en base64)
+        if 4 * math.ceil(size / 3) > EXPORT_MAX_BODY_BYTES:
+            obj['Body'].close()
+            return snapshot_redirect(key, etag)
+        extra["Content-Encoding"] = "gzip"
+        response = make_response(200, base64.b64encode(obj['Body'].read()).decode('ascii'), headers=extra)
+        response['isBase64Encoded'] = True
+        return response
+    data = None
+    if size <= EXPORT_MAX_BODY_BYTES:
+        data = inflate_snapshot(obj['Body'].read(), EXPORT_MAX_BODY_BYTES)
+    if data is None:
+        obj['Body'].close()
+        return snapshot_redirect(key, etag)
+    return make_response(200, data.decode('utf-8'), headers=extra)
+
+def parse_since(value):
+    """?since= en epoch (segundos) o ISO 8601 (sin zona = UTC) -> epoch entero."""
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise BadRequest("Parámetro 'since' inválido (epoch o ISO 8601)")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+def query_changes(since_param, limit, query_parameters):
+    """
+    GET /items?since=: filas escritas desde 'since' (incluido), en orden de
+    UpdatedAt. Consulta UpdatedIndex tramo a tramo, desde el de 'since' hasta
+    el actual, así que el coste depende de lo que ha cambiado y no del
+    tamaño de la tabla. El cursor guarda el tramo y la posición dentro de él.
+    """
+    since = parse_since(since_param)
+    now = int(time.time())
+    if since < now - SINCE_MAX_SECONDS:
+        raise BadRequest(f"'since' no puede ser anterior a {SINCE_MAX_SECONDS} segundos; usa el listado completo")
+    first_bucket = since - since % UPDATED_BUCKET_SECONDS
+    buckets = list(range(first_bucket, now - now % UPDATED_BUCKET_SECONDS + 1, UPDATED_BUCKET_SECONDS))
+
+    exclusive_start = None
+    if query_parameters.get('cursor'):
+        token = decode_token(query_parameters['cursor'])
+        if not isinstance(token, dict) or token.get('bucket') not in buckets:
+            raise BadRequest("Parámetro 'cursor' inválido")
+        buckets = buckets[buckets.index(token['bucket']):]
+        if token.get('key') is not None:
+            exclusive_start = start_key(token['key'], UPDATED_KEY_ATTRIBUTES)
+
+    names = {'#bucket': 'UpdatedBucket', '#at': 'UpdatedAt'}
+    projection = projection_options(query_parameters.get('fields'), names)
+    items = []
+    next_cursor = None
+    for position, bucket in enumerate(buckets):
+        while True:
+            kwargs = dict(
+                TableName=TABLE_NAME,
+                IndexName=UPDATED_INDEX,
+                KeyConditionExpression='#bucket = :bucket AND #at >= :since',
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={':bucket': {'S': str(bucket)}, ':since': {'N': str(since)}},
+                Limit=limit - len(items),
+                **projection
+            )
+            if exclusive_start:
+                kwargs['ExclusiveStartKey'] = exclusive_start
+            response = dynamodb_client.query(**kwargs)
+            items.extend(item_to_json(item) for item in response.get('Items', []))
+            exclusive_start = response.get('LastEvaluatedKey')
+            if len(items) >= limit or not exclusive_start:
+                break
+        if len(items) >= limit:
+            if exclusive_start:
+                # Clave física tal cual, como en encode_cursor (item_to_json pasaría
+                # Store#n a la tienda lógica y el cursor no serviría)
+                next_cursor = {
+                    'bucket': bucket,
+                    'key': {name: attribute_to_json(value) for name, value in exclusive_start.items()}
+                }
+            elif position + 1 < len(buckets):
+                next_cursor = {'bucket': buckets[position + 1], 'key': None}
+            break
+
+    return make_response(200, {
+        'items': items,
+        'next_cursor': encode_token(next_cursor) if next_cursor else None,
+        # Para el siguiente sondeo: since=server_time (puede repetir filas del límite)
+        'server_time': now
+    })
+
+def query_product(item, limit, query_parameters):
+    """
+    GET /products/{item}: qué tiendas tienen el artículo, con Query sobre
+    ItemIndex (lee solo las coincidencias, no la tabla). Ordenado por Count
+    de mayor a menor; ?min_count= / ?max_count= se aplican sobre la clave
+    de orden del índice (KeyConditionExpression), no como filtro.
+    """
+    names = {'#item': 'Item'}
+    values = {':item': {'S': item}}
+    condition = '#item = :item'
+    min_count = parse_count(query_parameters, 'min_count')
+    max_count = parse_count(query_parameters, 'max_count')
+    if min_count is not None or max_count is not None:
+        names['#count'] = 'Count'
+        if min_count is not None and max_count is not None:
+            condition += ' AND #count BETWEEN :min_count AND :max_count'
+        elif min_count is not None:
+            condition += ' AND #count >= :min_count'
+        else:
+            condition += ' AND #count <= :max_count'
+        if min_count is not None:
+            values[':min_count'] = {'N': str(min_count)}
+        if max_count is not None:
+            values[':max_count'] = {'N': str(max_count)}
+
+    cursor = decode_cursor(query_parameters.get('cursor'), key_attributes=KEY_ATTRIBUTES + ('Count',))
+    if cursor and cursor['Item']['S'] != item:
+        raise BadRequest("El cursor no corresponde a este artículo")
+    page = read_page(
+        dynamodb_client.query, limit, cursor,
+        IndexName=ITEM_INDEX,
+        KeyConditionExpression=condition,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ScanIndexForward=False
+    )
+    return make_response(200, page)
+
+def get_item(store, item, query_parameters):
+    """GET /items/{store}/{item}: un solo GetItem por clave."""
+    names = {}
+    kwargs = projection_options(query_parameters.get('fields'), names)
+    if names:
+        kwargs['ExpressionAttributeNames'] = names
+    response = dynamodb_client.get_item(
+        TableName=TABLE_NAME,
+        Key={'Store': {'S': shard_key(store, item)}, 'Item': {'S': item}},
+        **kwargs
+    )
+    if 'Item' not in response:
+        return make_response(404, {"error": "Item no encontrado"})
+    return make_response(200, item_to_json(response['Item']))
+
+def parse_batch_keys(body):
+    """
+    Lee el cuerpo de POST /items/batch: {"keys": [{"Store": ..., "Item": ...}]}.
+    Devuelve las claves sin repetir (BatchGetItem rechaza duplicados).
+    """
+    try:
+        keys = json.loads(body or '{}').get('keys')
+    except (ValueError, AttributeError):
+        raise BadRequest("Cuerpo JSON inválido")
+    if not isinstance(keys, list) or not keys:
+        raise BadRequest("Se espera {\"keys\": [{\"Store\": ..., \"Item\": ...}, ...]}")
+    if len(keys) > BATCH_GET_MAX_KEYS:
+        raise BadRequest(f"Como máximo {BATCH_GET_MAX_KEYS} claves por petición")
+    unique = {}
+    for key in keys:
+        if (not isinstance(key, dict)
+                or not all(isinstance(key.get(k), str) and key.get(k) for k in KEY_ATTRIBUTES)):
+            raise BadRequest("Cada clave necesita 'Store' e 'Item' (texto)")
+        unique[(key['Store'], key['Item'])] = None
+    return list(unique)
+
+def batch_get_chunk(keys, projection):
+    """
+    Un BatchGetItem de hasta 100 claves, reintentando las UnprocessedKeys
+    con backoff exponencial y jitter.
+    """
+    request = {'Keys': [{'Store': {'S': shard_key(s, i)}, 'Item': {'S': i}} for s, i in keys]}
+    request.update(projection)
+    items = []
+    attempt = 0
+    while request['Keys']:
+        response = dynamodb_client.batch_get_item(RequestItems={TABLE_NAME: request})
+        items.extend(response.get('Responses', {}).get(TABLE_NAME, []))
+        unprocessed = response.get('UnprocessedKeys', {}).get(TABLE_NAME)
+        if not unprocessed:
+            break
+        attempt += 1
+        if attempt > BATCH_GET_MAX_RETRIES:
+            raise Exception(f"{len(unprocessed['Keys'])} claves sin procesar tras {BATCH_GET_MAX_RETRIES} reintentos")
+        time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+        request = unprocessed
+    return items
+
+def batch_get(body, query_parameters):
+    """
+    POST /items/batch: las claves se reparten en BatchGetItem de 100 que se
+    ejecutan en paralelo. Devuelve los items encontrados y las claves que no existen.
+    """
+    keys = parse_batch_keys(body)
+    names = {}
+    projection = projection_options(query_parameters.get('fields'), names)
+    if projection:
+        # Las claves hacen falta para saber qué items faltan; solo se añaden
+        # las que no estén ya en 'fields' (rutas repetidas dan ValidationException)
+        extra = [name for name in KEY_ATTRIBUTES if name not in names.values()]
+        for i, name in enumerate(extra):
+            names[f'#k{i}'] = name
+        if extra:
+            projection['ProjectionExpression'] += ', ' + ', '.join(f'#k{i}' for i in range(len(extra)))
+        projection['ExpressionAttributeNames'] = names
+
+    chunks = [keys[i:i + BATCH_GET_SIZE] for i in range(0, len(keys), BATCH_GET_SIZE)]
+    with ThreadPoolExecutor(max_workers=max(1, min(BATCH_GET_CONCURRENCY, len(chunks)))) as pool:
+        results = pool.map(lambda chunk: batch_get_chunk(chunk, projection), chunks)
+        items = [item_to_json(raw) for raw_items in results for raw in raw_items]
+
+    found = {(item['Store'], item['Item']) for item in items}
+    missing = [{'Store': s, 'Item': i} for s, i in keys if (s, i) not in found]
+    return make_response(200, {"items": items, "missing": missing})
+
+def decode_shard_cursor(cursor, store, shards):
+    """
+    Cursor de una tienda repartida: {"store": ..., "shards": {"0": item, ...}}
+    con la última Item servida de cada partición pendiente (null si aún no
+    se ha servido ninguna). Sin cursor, todas las particiones desde el principio.
+    """
+    if not cursor:
+        return {index: None for index in range(shards)}
+    token = decode_token(cursor)
+    if not isinstance(token, dict) or token.get('store') != store or not isinstance(token.get('shards'), dict):
+        raise BadRequest("Parámetro 'cursor' inválido")
+    positions = {}
+    for index, position in token['shards'].items():
+        if not index.isdigit() or int(index) >= shards or not (position is None or isinstance(position, str)):
+            raise BadRequest("Parámetro 'cursor' inválido")
+        positions[int(index)] = position
+    return positions
+
+def query_sharded_store(store, limit, cursor, options):
+    """
+    GET /items/{store} de una tienda de SHARDED_STORES: una Query por
+    partición en paralelo y mezcla por Item, con el mismo orden y tamaño de
+    página que una tienda sin repartir. Solo se sirven las filas hasta la
+    menor LastEvaluatedKey de las particiones (lo que venga después en otra
+    partición aún no se ha leído); cada partición sigue en su próxima página
+    desde la última fila servida.
+    """
+    partitions = store_partitions(store)
+    positions = decode_shard_cursor(cursor, store, len(partitions))
+    names = dict(options.get('ExpressionAttributeNames', {}), **{'#pk': 'Store'})
+    projection = options.get('ProjectionExpression')
+    added_item = False
+    if projection and 'Item' not in names.values():
+        # Item hace falta para mezclar; se quita de la respuesta al final
+        names['#k'] = 'Item'
+        projection += ', #k'
+        added_item = True
+
+    def fetch(index):
+        kwargs = dict(options, TableName=TABLE_NAME, Limit=limit, KeyConditionExpression='#pk = :store',
+                      ExpressionAttributeNames=names)
+        kwargs['ExpressionAttributeValues'] = dict(options.get('ExpressionAttributeValues', {}),
+                                                   **{':store': {'S': partitions[index]}})
+        if projection:
+            kwargs['ProjectionExpression'] = projection
+        if positions[index] is not None:
+            kwargs['ExclusiveStartKey'] = {'Store': {'S': partitions[index]}, 'Item': {'S': positions[index]}}
+        response = dynamodb_client.query(**kwargs)
+        last_key = response.get('LastEvaluatedKey')
+        return response.get('Items', []), last_key['Item']['S'] if last_key else None
+
+    active = sorted(positions)
+    with ThreadPoolExecutor(max_workers=max(1, len(active))) as pool:
+        results = dict(zip(active, pool.map(fetch, active)))
+
+    bounds = [last for _, last in results.values() if last is not None]
+    bound = min(bounds) if bounds else None
+    candidates = sorted(
+        ((raw['Item']['S'], index, raw) for index, (raw_items, _) in results.items() for raw in raw_items
+         if bound is None or raw['Item']['S'] <= bound),
+        key=lambda candidate: candidate[0]
+    )[:limit]
+
+    served = {}
+    for item, index, _ in candidates:
+        count, _ = served.get(index, (0, None))
+        served[index] = (count + 1, item)
+    next_positions = {}
+    for index, (raw_items, last) in results.items():
+        count, last_served = served.get(index, (0, None))
+        if count == len(raw_items):
+            # Todo lo leído de la partición se ha servido: sigue tras su LastEvaluatedKey
+            if last is not None:
+                next_positions[str(index)] = last
+        else:
+            next_positions[str(index)] = last_served if count else positions[index]
+
+    items = [item_to_json(raw) for _, _, raw in candidates]
+    if added_item:
+        for item in items:
+            item.pop('Item', None)
+    next_cursor = encode_token({'store': store, 'shards': next_positions}) if next_positions else None
+    return make_response(200, {'items': items, 'next_cursor': next_cursor})
+
+def list_stores(limit, query_parameters):
+    """GET /stores: los totales de cada tienda, paginados (Scan de la tabla de agregados)."""
+    cursor = decode_cursor(query_parameters.get('cursor'), key_attributes=AGGREGATE_KEY_ATTRIBUTES)
+    page = read_page(dynamodb_client.scan, limit, cursor, TableName=AGGREGATES_TABLE_NAME)
+    return make_response(200, page)
+
+def store_summary(store):
+    """GET /stores/{store}/summary: un solo GetItem en la tabla de agregados."""
+    response = dynamodb_client.get_item(
+        TableName=AGGREGATES_TABLE_NAME,
+        Key={'Store': {'S': store}}
+    )
+    if 'Item' not in response:
+        return make_response(404, {"error": "Tienda no encontrada"})
+    return make_response(200, item_to_json(response['Item']))
+
+def is_stores_path(raw_path):
+    """Rutas de agregados por tienda (/stores y /stores/{store}/summary)."""
+    return raw_path == '/stores' or raw_path.startswith('/stores/')
+
+def route(raw_path, store, query_parameters, headers, encoding=None, item=None, method='GET', body=None, job=None):
+    """Resuelve la ruta y devuelve la respuesta HTTP (sin caché)."""
+    try:
+        if method == 'POST' and raw_path == '/items/batch':
+            # Ruta: POST /items/batch (varias claves concretas)
+            return batch_get(body, query_parameters)
+        elif method != 'GET':
+            return make_response(404, {"error": "Ruta no encontrada"})
+
+        limit = parse_limit(query_parameters.get('limit'))
+
+        if raw_path == '/stores':
+            # Ruta: GET /stores (totales de todas las tiendas)
+            return list_stores(limit, query_parameters)
+
+        elif is_stores_path(raw_path) and store and raw_path.endswith('/summary'):
+            # Ruta: GET /stores/{store}/summary (totales de una tienda)
+            return store_summary(store)
+
+        elif is_stores_path(raw_path):
+            return make_response(404, {"error": "Ruta no encontrada"})
+
+        if raw_path == '/items/export':
+            # Ruta: GET /items/export?format=ndjson|csv
+            # Toda la tabla, por partes a S3, en una invocación asíncrona
+            fmt = query_parameters.get('format', 'ndjson')
+            if fmt not in EXPORT_FORMATS:
+                raise BadRequest("Parámetro 'format' inválido (ndjson o csv)")
+            return start_export(fmt)
+
+        if raw_path.startswith('/items/export/'):
+            # Ruta: GET /items/export/{job} (estado; 303 a la URL al terminar)
+            return export_status(job)
+
+        if (query_parameters.get('view') == 'snapshot' and (store or raw_path == '/items')
+                and not has_filters(query_parameters)):
+            # Ruta: GET /items?view=snapshot y GET /items/{store}?view=snapshot
+            # Snapshot precalculado en S3, sin leer DynamoDB. Si aún no existe,
+            # se sigue por la ruta normal; las páginas siguientes llevan un
+            # cursor de DynamoDB y también, para no mezclar ambas fuentes.
+            cursor = snapshot_cursor(query_parameters)
+            if cursor is not None or not query_parameters.get('cursor'):
+                paged = cursor is not None or query_parameters.get('limit')
+                response = serve_snapshot(store, headers, encoding, limit if paged else None, cursor)
+                if response is not None:
+                    return response
+
+        if raw_path == '/items' and not store and query_parameters.get('since'):
+            # Ruta: GET /items?since=<timestamp> (solo lo que ha cambiado)
+            return query_changes(query_parameters['since'], limit, query_parameters)
+
+        elif raw_path == '/items' and not store and query_parameters.get('export') == 'all':
+            # Ruta: GET /items?export=all
+            # Para clientes que necesitan todas las filas de una vez
+            return make_response(200, export_all())
+
+        elif raw_path == '/items' and not store:
+            # Ruta: GET /items
+            # Scan paginado: cada respuesta trae como mucho 'limit' elementos y
+            # el cliente sigue next_cursor, así el tamaño y la latencia de la
+            # respuesta no crecen con la tabla.
+            # ?low_stock=true recorre solo el índice disperso, no la tabla.
+            options, key_attributes = read_options(query_parameters)
+            cursor = decode_cursor(query_parameters.get('cursor'), key_attributes=key_attributes)
+            return make_response(200, read_page(dynamodb_client.scan, limit, cursor, **options))
+
+        elif raw_path.startswith('/products/') and item:
+            # Ruta: GET /products/{item} (el artículo en todas las tiendas)
+            return query_product(item, limit, query_parameters)
+
+        elif store and item:
+            # Ruta: GET /items/{store}/{item} (un solo artículo)
+            return get_item(store, item, query_parameters)
+
+        elif store:
+            # Ruta: GET /items/{store}
+            # Usa Query (eficiente) para buscar por la Partition Key (Store).
+            # Con ?low_stock=true la Query va al índice disperso (LowStock = Store).
+            options, key_attributes = read_options(query_parameters)
+            if store in SHARDED_STORES and 'IndexName' not in options:
+                # Tienda repartida en varias particiones (el índice usa la tienda lógica)
+                return query_sharded_store(store, limit, query_parameters.get('cursor'), options)
+            cursor = decode_cursor(query_parameters.get('cursor'), store, key_attributes)
+            partition_key = LOW_STOCK_ATTRIBUTE if 'IndexName' in options else 'Store'
+            options.setdefault('ExpressionAttributeNames', {})['#pk'] = partition_key
+            options.setdefault('ExpressionAttributeValues', {})[':store'] = {'S': store}
+            page = read_page(dynamodb_client.query, limit, cursor,
+                             KeyConditionExpression='#pk = :store', **options)
+            return make_response(200, page)
+
+        else:
+            return make_response(404, {"error": "Ruta no encontrada"})
+
+    except BadRequest as e:
+        return make_response(400, {"error": str(e)})
+    except ExportTooLarge:
+        return make_response(413, {"error": "El inventario no cabe en una sola respuesta; usa la paginación (?limit=&cursor=)"})
+    except Exception as e:
+        print(f"Error al consultar DynamoDB: {e}")
+        return make_response(500, {"error": f"Error interno del servidor: {str(e)}"})
+
+def lambda_handler(event, context):
+    """
+    Handler principal de la Lambda.
+    Rutas:
+    - GET /items        -> Escanea la tabla, una página cada vez
+    - GET /items/{store} -> Hace Query por 'Store', una página cada vez
+    Ambas aceptan ?limit= y ?cursor= (el next_cursor de la página anterior),
+    y filtros: ?fields=, ?min_count=, ?max_count= y ?low_stock=true.
+    - GET /items?export=all -> Toda la tabla en una respuesta (Scan paralelo)
+    - GET /items?since=<timestamp> -> Filas cambiadas desde entonces (UpdatedIndex)
+    - ?view=snapshot    -> Snapshot precalculado en S3 (ETag / 304)
+    - GET /items/export?format=ndjson|csv -> Lanza una exportación a S3 (202 con su estado)
+    - GET /items/export/{job} -> Estado de la exportación (303 a URL prefirmada al terminar)
+    - GET /items/{store}/{item} -> GetItem de un artículo
+    - POST /items/batch -> BatchGetItem en paralelo de una lista de claves
+    - GET /products/{item} -> Query paginada del artículo en todas las tiendas (ItemIndex)
+    - GET /stores -> Totales (SKUs, unidades, SKUs con bajo stock) de cada tienda
+    - GET /stores/{store}/summary -> Totales de una tienda (GetItem)
+    Invocada con {"export_job": {...}} (por la propia API) hace la exportación.
+    """
+    if event.get('export_job'):
+        return run_export_job(event['export_job'])
+
+    print("Evento de API Gateway recibido:", event)
+    
+    # API Gateway HTTP API (payload v2.0)
+    raw_path = event.get('rawPath', '/')
+    path_parameters = event.get('pathParameters') or {}
+    query_parameters = event.get('queryStringParameters') or {}
+    store = path_parameters.get('store')
+    item = path_parameters.get('item')
+    job = path_parameters.get('job')
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    method = event.get('requestContext', {}).get('http', {}).get('method', 'GET')
+    body = event.get('body')
+    if body and event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+
+    # Caché en caliente (solo GET): un acierto no toca la tabla de inventario,
+    # ni serializa JSON ni comprime. Los agregados no se cachean: los actualiza
+    # el stream después de subir la versión del inventario y ya son lecturas O(1).
+    version = inventory_version() if method == 'GET' and not is_stores_path(raw_path) else None
+    encoding = choose_encoding(headers.get('accept-encoding'))
+    key = cache_key(raw_path, store, query_parameters, encoding)
+    if version is not None:
+        cached = response_cache.get(key, version)
+        if cached is not None:
+            if etag_matches(headers.get('if-none-match'), cached['headers'].get('ETag')):
+                return not_modified(cached['headers']['ETag'])
+            return dict(cached, headers=dict(cached['headers'], **{"X-Cache": "HIT"}))
+
+    # Se comprime antes de cachear: un acierto tampoco vuelve a comprimir
+    response = compress_response(
+        route(raw_path, store, query_parameters, headers, encoding, item, method, body, job), encoding
+    )
+    if version is not None and response['statusCode'] == 200:
+        response_cache.put(key, version, response)
+    return dict(response, headers=dict(response['headers'], **{"X-Cache": "MISS"}))
\ No newline at end of file
@@ -1,102 +1,2232 @@
-# lambdas/load_inventory/lambda_function.py
-import os
-import boto3
-import csv
-import io
-import logging
-
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-
-dynamodb = boto3.resource('dynamodb')
-# Obtenemos el nombre de la tabla de una variable de entorno
-TABLE_NAME = os.environ.get('DYNAMO_TABLE_NAME', 'Inventory')
-table = dynamodb.Table(TABLE_NAME)
-
-def parse_csv_row(row):
-    """
-    Normaliza las cabeceras del CSV (Store, Item, Count)
-    independientemente de mayúsculas/minúsculas o idioma.
-    """
-    cleaned = { (k or "").strip().lower(): v.strip() for k, v in row.items() }
-    
-    store = cleaned.get("store") or cleaned.get("tienda")
-    item = cleaned.get("item") or cleaned.get("articulo")
-    
-    count_str = cleaned.get("count") or cleaned.get("cantidad") or "0"
-    try:
-        count = int(count_str)
-    except ValueError:
-        count = 0
-        
-    if not store or not item:
-        return None
-        
-    return {
-        "Store": store,
-        "Item": item,
-        "Count": count
-    }
-
-def lambda_handler(event, context):
-    """
-    Handler principal de la Lambda.
-    """
-    logger.info("Evento S3 recibido: %s", event)
-    
-    # 1. Obtener el bucket y la clave (nombre del archivo) del evento S3
-    try:
-        s3_event = event['Records'][0]['s3']
-        bucket_name = s3_event['bucket']['name']
-        object_key = s3_event['object']['key']
-    except (KeyError, IndexError) as e:
-        logger.error("Error al parsear el evento S3: %s", e)
-        return {'statusCode': 400, 'body': 'Evento S3 mal formado.'}
-
-    # 2. Leer el objeto CSV de S3
-    s3_client = boto3.client('s3')
-    try:
-        response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-        csv_content = response['Body'].read().decode('utf-8')
-        logger.info("CSV leído correctamente de S3.")
-    except Exception as e:
-        logger.error("Error al leer el objeto de S3: %s", e)
-        return {'statusCode': 500, 'body': f'Error al leer {object_key} de {bucket_name}'}
-
-    # 3. Parsear el CSV y preparar la carga a DynamoDB
-    # Usamos io.StringIO para tratar el string del CSV como un archivo
-    csv_file = io.StringIO(csv_content)
-    reader = csv.DictReader(csv_file)
-    
-    items_to_put = []
-    for row in reader:
-        parsed_item = parse_csv_row(row)
-        if parsed_item:
-            items_to_put.append({
-                'PutRequest': {
-                    'Item': parsed_item
-                }
-            })
-
-    if not items_to_put:
-        logger.warning("No se encontraron items válidos en el CSV.")
-        return {'statusCode': 200, 'body': 'No se encontraron items válidos.'}
-
-    # 4. Cargar en DynamoDB usando BatchWriteItem
-    # BatchWriteItem es más eficiente que PutItem en un bucle.
-    # Maneja lotes de 25 items a la vez.
-    try:
-        with table.batch_writer() as batch:
-            for i in range(0, len(items_to_put), 25):
-                batch_chunk = items_to_put[i:i+25]
-                for item_request in batch_chunk:
-                    batch.put_item(Item=item_request['PutRequest']['Item'])
-                    
-        logger.info("Carga exitosa de %d items a DynamoDB.", len(items_to_put))
-        return {
-            'statusCode': 200,
-            'body': f'Se cargaron {len(items_to_put)} items en la tabla {TABLE_NAME}'
-        }
-    except Exception as e:
-        logger.error("Error al escribir en DynamoDB: %s", e)
-        return {'statusCode': 500, 'body': f'Error al escribir en DynamoDB: {e}'}
\ No newline at end of file
+# lambdas/load_inventory/lambda_function.py
+import os
+import boto3
+from boto3.dynamodb.conditions import Key
+import csv
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import logging
+import math
+import random
+import threading
+import time
+import queue
+import uuid
+import zlib
+from collections import OrderedDict
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, groupby, islice
+from botocore.exceptions import ClientError
+from urllib.parse import quote, unquote_plus
+# Tiendas muy grandes con la clave repartida (módulo común de lambdas/shared):
+# las filas en memoria (diff, duplicados, deltas) usan la tienda lógica; la
+# clave física solo se calcula al escribir. LowStock sigue siendo la tienda lógica.
+from sharding import shard_key, store_partitions, logical_store
+
+# Dependencias opcionales (no vienen en el runtime de Lambda: se añaden
+# con una capa). Sin ellas solo fallan los ficheros .zst / .parquet.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import pyarrow.fs as pa_fs
+    import pyarrow.parquet as pq
+except ImportError:
+    pa_fs = pq = None
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+# Obtenemos el nombre de la tabla de una variable de entorno
+TABLE_NAME = os.environ.get('DYNAMO_TABLE_NAME', 'Inventory')
+table = dynamodb.Table(TABLE_NAME)
+# Tabla de estado (seguimiento de cargas repartidas en rangos)
+STATE_TABLE_NAME = os.environ.get('STATE_TABLE_NAME', 'InventoryState')
+state_table = dynamodb.Table(STATE_TABLE_NAME)
+s3_client = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+
+# Tamaño de cada lectura del stream de S3 (bytes)
+READ_CHUNK_SIZE = int(os.environ.get('READ_CHUNK_SIZE', 1024 * 1024))
+
+# Escritura paralela en DynamoDB (configurable por despliegue)
+WRITE_CONCURRENCY = int(os.environ.get('WRITE_CONCURRENCY', 4))
+WRITE_MAX_IN_FLIGHT = int(os.environ.get('WRITE_MAX_IN_FLIGHT', WRITE_CONCURRENCY * 2))
+WRITE_MAX_RETRIES = int(os.environ.get('WRITE_MAX_RETRIES', 8))
+BATCH_SIZE = 25 # Límite de BatchWriteItem
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 5.0
+KEY_ATTRIBUTES = ('Store', 'Item')
+# Índice disperso de bajo stock: solo los items con Count < umbral llevan el
+# atributo LowStock (= Store), así el GSI contiene únicamente esos items
+LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 5))
+LOW_STOCK_ATTRIBUTE = 'LowStock'
+# Cada fila escrita lleva UpdatedAt (epoch en segundos) y UpdatedBucket (inicio
+# del tramo de UPDATED_BUCKET_SECONDS al que pertenece, como texto). El índice
+# UpdatedIndex (UpdatedBucket + UpdatedAt) sirve GET /items?since=; la API
+# debe usar el mismo tamaño de tramo.
+UPDATED_BUCKET_SECONDS = int(os.environ.get('UPDATED_BUCKET_SECONDS', 3600))
+THROTTLING_ERRORS = (
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+)
+# Motivos de cancelación de una transacción que se reintentan
+TRANSACTION_RETRY_REASONS = (
+    'ThrottlingError',
+    'ProvisionedThroughputExceeded',
+    'RequestLimitExceeded',
+    'TransactionConflict',
+)
+
+# Fan-out: a partir de este tamaño el fichero se reparte en rangos de bytes
+# que procesan copias de esta Lambda en paralelo.
+FANOUT_MIN_BYTES = int(os.environ.get('FANOUT_MIN_BYTES', 8 * 1024 * 1024))
+FANOUT_RANGE_BYTES = int(os.environ.get('FANOUT_RANGE_BYTES', 4 * 1024 * 1024))
+FANOUT_MAX_RANGES = int(os.environ.get('FANOUT_MAX_RANGES', 200))
+NEWLINE_PROBE_BYTES = 64 * 1024
+
+# Checkpoints: margen de tiempo (ms) antes del timeout en el que se deja
+# de leer, se guarda el offset y la carga continúa en otra invocación.
+CHECKPOINT_MARGIN_MS = int(os.environ.get('CHECKPOINT_MARGIN_MS', 8000))
+CHECKPOINT_CHECK_ROWS = 500
+
+# Formatos de entrada: (tipo, compresión) según el sufijo de la clave.
+# Si el sufijo no es conocido se decide por los primeros bytes (magic).
+FORMAT_SUFFIXES = (
+    ('.csv.gz', ('csv', 'gzip')),
+    ('.csv.zst', ('csv', 'zstd')),
+    ('.jsonl.gz', ('jsonl', 'gzip')),
+    ('.ndjson.gz', ('jsonl', 'gzip')),
+    ('.jsonl.zst', ('jsonl', 'zstd')),
+    ('.ndjson.zst', ('jsonl', 'zstd')),
+    ('.jsonl', ('jsonl', None)),
+    ('.ndjson', ('jsonl', None)),
+    ('.parquet', ('parquet', None)),
+    ('.csv', ('csv', None)),
+)
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+PARQUET_MAGIC = b"PAR1"
+PARQUET_BATCH_ROWS = 10000
+
+# Alias de cabecera admitidos, por orden de preferencia
+STORE_HEADERS = ("store", "tienda")
+ITEM_HEADERS = ("item", "articulo")
+COUNT_HEADERS = ("count", "cantidad")
+# Ficheros de deltas (ventas/reposiciones: +3, -1): columna Delta en vez de Count
+DELTA_HEADERS = ("delta", "cambio")
+# Los deltas se aplican por ventanas fijas de DELTA_FLUSH_ROWS filas (el
+# checkpoint solo se guarda al cerrar una ventana). Cada tramo de hasta 99
+# claves va en una transacción con una marca en la tabla de estado (subida
+# del objeto + posición de la ventana + tramo): un reintento, una reentrega
+# de SQS o una nueva reclamación de la misma subida no vuelve a sumar.
+# Las repeticiones de una clave se juntan dentro de cada ventana, no en todo
+# el fichero: una clave que aparece en N ventanas se escribe N veces (cada
+# vez en una transacción, el doble de WCU, y con un BatchGetItem por tramo).
+DELTA_FLUSH_ROWS = int(os.environ.get('DELTA_FLUSH_ROWS', 2000))
+DELTA_TRANSACT_KEYS = 99 # TransactWriteItems admite 100 acciones: 99 claves + la marca
+
+# Filas repetidas (misma Store + Item) dentro de un fichero:
+# - 'last': gana la última fila (comportamiento original)
+# - 'sum': se suman los Count
+# - 'reject': se queda la primera y las repetidas se descartan
+# Se agrupan dentro de una ventana de DUPLICATE_WINDOW claves para que
+# la memoria siga acotada. Con 'sum' y 'reject' las claves que salen de la
+# ventana se recuerdan (como mucho DUPLICATE_SEEN_MAX; si hay más, la carga
+# falla): una repetición más separada se suma con ADD o se descarta. Solo
+# se recuerdan dentro de una misma pasada: entre rangos de un fan-out o
+# pasadas de un checkpoint, una repetición vuelve a ser 'last'.
+DUPLICATE_POLICIES = ('last', 'sum', 'reject')
+DUPLICATE_KEY_POLICY = os.environ.get('DUPLICATE_KEY_POLICY', 'last').lower()
+DUPLICATE_WINDOW = int(os.environ.get('DUPLICATE_WINDOW', 20000))
+DUPLICATE_SEEN_MAX = int(os.environ.get('DUPLICATE_SEEN_MAX', 500000))
+
+# Modo de carga:
+# - 'full': escribe todas las filas del fichero sin leer antes la tabla,
+#   cada una con un UpdateItem condicional: las que no cambian se quedan
+#   como están (con su UpdatedAt) y no generan registro en el stream
+# - 'diff': solo escribe las filas nuevas o cuyo Count ha cambiado
+# - 'snapshot': como 'diff' y además borra las filas de las tiendas del
+#   fichero que ya no aparecen en él (el fichero es una foto completa)
+INGEST_MODE_FULL = 'full'
+INGEST_MODE_DIFF = 'diff'
+INGEST_MODE_SNAPSHOT = 'snapshot'
+INGEST_MODE = os.environ.get('INGEST_MODE', INGEST_MODE_FULL).lower()
+
+# Manifiesto de subidas: si un objeto llega otra vez con el mismo ETag y
+# tamaño ya ingerido, se ignora sin leerlo. Una reclamación 'PROCESSING'
+# más antigua que el lease se considera abandonada; la carga la renueva en
+# cada checkpoint y en cada rango terminado. deploy.py lo deriva de la
+# visibilidad de la cola de subidas (debe ser menor que ella).
+DEDUP_UPLOADS = os.environ.get('DEDUP_UPLOADS', 'true').lower() == 'true'
+DEDUP_LEASE_SECONDS = int(os.environ.get('DEDUP_LEASE_SECONDS', 150))
+
+# Objetos de un mismo evento que se procesan a la vez
+OBJECT_CONCURRENCY = int(os.environ.get('OBJECT_CONCURRENCY', 4))
+STATE_TTL_SECONDS = 7 * 24 * 3600
+# Item de la tabla de estado con la "versión" del inventario: se incrementa
+# tras cada carga completada y get_inventory_api invalida su caché al cambiar
+INVENTORY_VERSION_KEY = 'inventory#version'
+
+# Snapshots materializados que sirve get_inventory_api (?view=snapshot):
+# JSON comprimido con gzip, uno global y uno por tienda. Sin bucket no se publican.
+# Tras cada carga se publican en otra invocación ({'snapshot_task': ...},
+# en la función SNAPSHOT_FUNCTION_NAME, con su propio timeout): el global y
+# solo las tiendas que aparecen en la carga, comprimiendo y subiendo por
+# partes según se leen (memoria constante). El puntero solo avanza con la
+# versión del inventario: una publicación antigua no pisa una más reciente.
+# Cada publicación es una generación nueva bajo su propio prefijo
+# (snapshots/all/<generación>/ o snapshots/stores/<tienda>/<generación>/):
+# full.json.gz con todo y part-<n>.json.gz con páginas fijas de
+# SNAPSHOT_PAGE_ROWS filas, para que la API sirva una página con una sola
+# lectura. El item snapshot#... de la tabla de estado apunta a la generación
+# publicada; al sustituirla se borra la anterior.
+SNAPSHOT_BUCKET = os.environ.get('SNAPSHOT_BUCKET', '')
+# Función que publica los snapshots (mismo código, timeout largo); vacía: esta misma
+SNAPSHOT_FUNCTION_NAME = os.environ.get('SNAPSHOT_FUNCTION_NAME', '')
+SNAPSHOT_PREFIX = 'snapshots/'
+SNAPSHOT_POINTER_PREFIX = 'snapshot#'
+SNAPSHOT_PART_BYTES = 8 * 1024 * 1024 # partes del multipart upload (mínimo de S3: 5 MB)
+SNAPSHOT_PAGE_ROWS = 1000 # = MAX_PAGE_SIZE de la API: una página de la API cabe en una del snapshot
+SNAPSHOT_GZIP_LEVEL = 6
+# Modo 'snapshot' en cargas de varias pasadas o rangos: cada pasada sube a
+# seen/<carga>/ del mismo bucket las claves que ha visto (ordenadas) y, al
+# terminar la última, un barrido ({'sweep_task': ...}) las mezcla con las
+# filas de cada tienda y borra las que no aparecen. Sin bucket esas cargas
+# se rechazan.
+SEEN_PREFIX = 'seen/'
+# Contadores que se acumulan entre pasadas y rangos de una misma carga
+# (contador de la tarea -> atributo del checkpoint / job en la tabla de estado)
+TASK_COUNTERS = {
+    'rows': 'RowsWritten',
+    'skipped': 'Skipped',
+    'deleted': 'Deleted',
+    'duplicates': 'Duplicates',
+    'throttles': 'Throttles'
+}
+
+def mark_low_stock(item):
+    """Añade LowStock al item si está por debajo del umbral (índice disperso)."""
+    if item["Count"] < LOW_STOCK_THRESHOLD:
+        item[LOW_STOCK_ATTRIBUTE] = item["Store"]
+    return item
+
+def shard_item(item):
+    """Pasa la clave del item (Store lógica) a la clave física de la tabla."""
+    item["Store"] = shard_key(item["Store"], item["Item"])
+    return item
+
+def updated_stamp(now=None):
+    """(UpdatedAt, UpdatedBucket) para el instante 'now' (por defecto, ahora)."""
+    now = int(now if now is not None else time.time())
+    return now, str(now - now % UPDATED_BUCKET_SECONDS)
+
+def stamp_updated(item):
+    """Marca el item con la hora de escritura (índice UpdatedIndex)."""
+    item["UpdatedAt"], item["UpdatedBucket"] = updated_stamp()
+    return item
+
+class RowMapper:
+    """
+    Resuelve una sola vez por fichero qué columnas son Store, Item y Count
+    (sin distinguir mayúsculas ni idioma) y convierte cada fila de csv.reader
+    (lista de valores) en un item sin volver a mirar las cabeceras.
+    Si no hay columna Count pero sí Delta, el fichero es de deltas y el
+    item lleva el delta en 'Count'.
+    """
+    def __init__(self, fieldnames):
+        positions = {}
+        for index, name in enumerate(fieldnames or []):
+            # Si una cabecera se repite gana la última
+            positions[(name or "").strip().lower()] = index
+        self.store = [positions[h] for h in STORE_HEADERS if h in positions]
+        self.item = [positions[h] for h in ITEM_HEADERS if h in positions]
+        self.count = [positions[h] for h in COUNT_HEADERS if h in positions]
+        self.is_delta = not self.count and any(h in positions for h in DELTA_HEADERS)
+        if self.is_delta:
+            self.count = [positions[h] for h in DELTA_HEADERS if h in positions]
+        self.width = max(self.store + self.item + self.count, default=-1) + 1
+        self.simple = len(self.store) == 1 and len(self.item) == 1 and len(self.count) <= 1
+
+    @staticmethod
+    def _first(row, indexes):
+        for index in indexes:
+            if index < len(row):
+                value = row[index].strip()
+                if value:
+                    return value
+        return ""
+
+    def __call__(self, row):
+        if self.simple and len(row) >= self.width:
+            # Camino rápido: una sola columna por campo y fila completa
+            store = row[self.store[0]].strip()
+            item = row[self.item[0]].strip()
+            count_str = row[self.count[0]].strip() if self.count else ""
+        else:
+            store = self._first(row, self.store)
+            item = self._first(row, self.item)
+            count_str = self._first(row, self.count)
+
+        if not store or not item:
+            return None
+        try:
+            count = int(count_str or "0")
+        except ValueError:
+            count = 0
+        return {"Store": store, "Item": item, "Count": count}
+
+class DictRowParser:
+    """
+    Igual que RowMapper para registros dict (JSON Lines, Parquet): resuelve
+    el mapeo una vez por cada conjunto de claves distinto.
+    """
+    def __init__(self):
+        self._mappers = {}
+        self.is_delta = False
+
+    def __call__(self, record):
+        keys = tuple(record)
+        mapper = self._mappers.get(keys)
+        if mapper is None:
+            mapper = self._mappers[keys] = RowMapper(keys)
+            if len(self._mappers) == 1:
+                self.is_delta = mapper.is_delta
+        return mapper(list(record.values()))
+
+class KeyAggregator:
+    """
+    Agrupa las filas con la misma (Store, Item) según DUPLICATE_KEY_POLICY
+    antes de pasarlas a 'emit'. Solo guarda las últimas 'window' claves.
+    Con 'sum', una repetición de una clave que ya salió de la ventana (y ya
+    se escribió) se pasa a 'emit_late' para sumarla con ADD; sin 'emit_late'
+    la carga falla en vez de pisar la suma.
+    """
+    def __init__(self, emit, policy=None, window=None, emit_late=None, seen_max=None):
+        self.emit = emit
+        self.emit_late = emit_late
+        self.policy = policy or DUPLICATE_KEY_POLICY
+        if self.policy not in DUPLICATE_POLICIES:
+            logger.warning("DUPLICATE_KEY_POLICY '%s' no válida. Se usa 'last'.", self.policy)
+            self.policy = 'last'
+        self.window = max(1, window or DUPLICATE_WINDOW)
+        self.seen_max = seen_max or DUPLICATE_SEEN_MAX
+        self.duplicates = 0
+        self.late_duplicates = 0
+        self._pending = OrderedDict()
+        # Con 'last' no hace falta: la última fila escrita es la que gana
+        self._emitted = set() if self.policy != 'last' else None
+
+    def add(self, item):
+        key = (item["Store"], item["Item"])
+        current = self._pending.get(key)
+        if current is None:
+            if self._emitted is not None and key in self._emitted:
+                self._add_late(key, item)
+                return
+            self._pending[key] = item
+            if len(self._pending) > self.window:
+                self._emit_oldest()
+            return
+
+        self.duplicates += 1
+        if self.policy == 'sum':
+            current["Count"] += item["Count"]
+        elif self.policy == 'reject':
+            if self.duplicates <= 10:
+                logger.warning("Fila repetida descartada: %s / %s.", item["Store"], item["Item"])
+        else:
+            self._pending[key] = item
+
+    def _emit_oldest(self):
+        key, item = self._pending.popitem(last=False)
+        if self._emitted is not None:
+            if len(self._emitted) >= self.seen_max:
+                raise RuntimeError(
+                    f"Más de {self.seen_max} claves distintas con la política '{self.policy}': "
+                    "no se pueden agrupar las filas repetidas (sube DUPLICATE_SEEN_MAX o usa 'last')."
+                )
+            self._emitted.add(key)
+        self.emit(item)
+
+    def _add_late(self, key, item):
+        """Repetición de una clave que ya salió de la ventana."""
+        self.duplicates += 1
+        self.late_duplicates += 1
+        if self.late_duplicates == 1:
+            logger.warning(
+                "Filas repetidas a más de %d claves de distancia (%s / %s): %s.",
+                self.window, key[0], key[1],
+                "se suman con ADD" if self.policy == 'sum' else "se descartan"
+            )
+        if self.policy == 'sum':
+            if self.emit_late is None:
+                raise RuntimeError(
+                    f"Fila repetida fuera de la ventana de {self.window} claves ({key[0]} / {key[1]}): "
+                    "no se puede sumar a la ya escrita (sube DUPLICATE_WINDOW)."
+                )
+            self.emit_late(item)
+
+    def flush(self):
+        while self._pending:
+            self.emit(self._pending.popitem(last=False)[1])
+
+class LineReader:
+    """
+    Decodifica el cuerpo de S3 de forma incremental, línea a línea.
+    Solo mantiene en memoria el bloque actual y la última línea incompleta,
+    así que el consumo es constante sea cual sea el tamaño del fichero.
+    'offset' es la posición absoluta (en bytes) tras la última línea entregada,
+    que es donde habría que retomar la lectura.
+    """
+    def __init__(self, body, offset=0, chunk_size=None):
+        self.body = body
+        self.offset = offset
+        self.chunk_size = chunk_size or READ_CHUNK_SIZE
+
+    def __iter__(self):
+        pending = b""
+        while True:
+            chunk = self.body.read(self.chunk_size)
+            if not chunk:
+                break
+            pending += chunk
+            # b"\n" nunca aparece dentro de un carácter multibyte UTF-8,
+            # por lo que es seguro cortar por bytes y decodificar cada línea.
+            lines = pending.split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                self.offset += len(line) + 1
+                yield line.decode('utf-8') + "\n"
+        if pending:
+            self.offset += len(pending)
+            yield pending.decode('utf-8')
+
+def detect_format(bucket_name, object_key):
+    """
+    Devuelve [tipo, compresión] del objeto: tipo 'csv', 'jsonl' o 'parquet'
+    y compresión None, 'gzip' o 'zstd'.
+    """
+    lower_key = object_key.lower()
+    for suffix, fmt in FORMAT_SUFFIXES:
+        if lower_key.endswith(suffix):
+            return list(fmt)
+
+    # Sufijo desconocido: miramos los primeros bytes
+    head = s3_client.get_object(Bucket=bucket_name, Key=object_key, Range="bytes=0-15")['Body'].read()
+    kind = 'jsonl' if '.json' in lower_key else 'csv'
+    if head.startswith(PARQUET_MAGIC):
+        return ['parquet', None]
+    if head.startswith(GZIP_MAGIC):
+        return [kind, 'gzip']
+    if head.startswith(ZSTD_MAGIC):
+        return [kind, 'zstd']
+    if head.lstrip().startswith(b"{"):
+        return ['jsonl', None]
+    return ['csv', None]
+
+def is_seekable_format(fmt):
+    """Texto sin comprimir: se puede leer por rangos de bytes."""
+    return fmt[0] != 'parquet' and fmt[1] is None
+
+def to_text_value(value):
+    """Convierte un valor de JSON/Parquet al texto que espera RowMapper."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class RecordStream:
+    """
+    Registros de un objeto de S3 en cualquiera de los formatos soportados,
+    leídos en streaming: listas de valores para CSV (con 'fieldnames') y
+    dicts de texto para JSON Lines y Parquet.
+    'position' indica dónde retomar la lectura tras el último registro
+    entregado: un offset en bytes para texto sin comprimir, o el número de
+    registros ya leídos para los formatos comprimidos y Parquet (que se
+    vuelven a leer desde el principio, pero sin reescribir nada).
+    """
+    def __init__(self, fmt, bucket_name, object_key, start=0, end=None, fieldnames=None, etag=None):
+        self.kind, self.compression = fmt
+        self.seekable = is_seekable_format(fmt)
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.start = start
+        self.end = end
+        # Sin rangos de bytes la cabecera se vuelve a leer en cada pasada
+        self.fieldnames = fieldnames if self.seekable else None
+        self.etag = etag
+        self.position = start
+
+    def row_parser(self):
+        """Función fila -> item para este fichero (cabeceras ya resueltas)."""
+        if self.kind == 'csv':
+            return RowMapper(self.fieldnames)
+        return DictRowParser()
+
+    def __iter__(self):
+        if self.kind == 'parquet':
+            return self._iter_parquet()
+        return self._iter_text()
+
+    def _open_body(self):
+        params = {'Bucket': self.bucket_name, 'Key': self.object_key}
+        if self.etag:
+            # Garantiza que todos los rangos/pasadas leen la misma versión del objeto
+            params['IfMatch'] = self.etag
+        if self.seekable and (self.start or self.end is not None):
+            params['Range'] = f"bytes={self.start}-{'' if self.end is None else self.end - 1}"
+        response = s3_client.get_object(**params)
+        self.etag = response.get('ETag', self.etag)
+        logger.info(
+            "Leyendo s3://%s/%s (%s, compresión %s) en streaming (%s bytes desde %d).",
+            self.bucket_name, self.object_key, self.kind, self.compression,
+            response.get('ContentLength'), self.start
+        )
+        return response['Body']
+
+    def _decompress(self, body):
+        if self.compression == 'gzip':
+            return gzip.GzipFile(fileobj=body, mode='rb')
+        if self.compression == 'zstd':
+            if zstandard is None:
+                raise RuntimeError("Los ficheros .zst necesitan el paquete 'zstandard' (capa de Lambda).")
+            return zstandard.ZstdDecompressor().stream_reader(body, read_size=READ_CHUNK_SIZE)
+        return body
+
+    def _iter_text(self):
+        body = self._open_body()
+        try:
+            lines = LineReader(self._decompress(body), offset=self.start if self.seekable else 0)
+            is_csv = self.kind == 'csv'
+            if is_csv:
+                rows = csv.reader(lines)
+                if self.fieldnames is None:
+                    self.fieldnames = next(rows, [])
+            else:
+                rows = (json.loads(line) for line in lines if line.strip())
+            for n, row in enumerate(rows, 1):
+                if self.seekable:
+                    self.position = lines.offset
+                elif n <= self.start:
+                    continue # Ya procesado en una pasada anterior
+                else:
+                    self.position = n
+                if not is_csv:
+                    row = {k: to_text_value(v) for k, v in row.items()}
+                yield row
+        finally:
+            body.close()
+
+    def _iter_parquet(self):
+        if pq is None:
+            raise RuntimeError("Los ficheros .parquet necesitan el paquete 'pyarrow' (capa de Lambda).")
+        filesystem = pa_fs.S3FileSystem(region=os.environ.get('AWS_REGION'))
+        with filesystem.open_input_file(f"{self.bucket_name}/{self.object_key}") as source:
+            parquet_file = pq.ParquetFile(source)
+            logger.info(
+                "Leyendo s3://%s/%s (parquet, %d row groups) desde el registro %d.",
+                self.bucket_name, self.object_key, parquet_file.num_row_groups, self.start
+            )
+            done = 0
+            # Un row group cada vez; los ya procesados se saltan sin leerlos
+            for group in range(parquet_file.num_row_groups):
+                group_rows = parquet_file.metadata.row_group(group).num_rows
+                if done + group_rows <= self.start:
+                    done += group_rows
+                    continue
+                for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS, row_groups=[group]):
+                    for row in batch.to_pylist():
+                        done += 1
+                        if done <= self.start:
+                            continue
+                        self.position = done
+                        yield {k: to_text_value(v) for k, v in row.items()}
+
+class ParallelBatchWriter:
+    """
+    Escritor de BatchWriteItem con varios hilos.
+    Cada hilo envía sus propios lotes de 25 items, reintenta los
+    UnprocessedItems con backoff exponencial con jitter y el número de
+    lotes en vuelo está limitado (el productor se bloquea si se supera).
+    Las filas de update_count van en los mismos lotes, pero cada una se
+    escribe con su propio UpdateItem condicional.
+    """
+    def __init__(self, table_name, concurrency=None, max_in_flight=None, max_retries=None):
+        self.table_name = table_name
+        self.concurrency = max(1, concurrency or WRITE_CONCURRENCY)
+        self.max_retries = max_retries if max_retries is not None else WRITE_MAX_RETRIES
+        self.client = dynamodb.meta.client # Acepta tipos Python (no DynamoDB JSON)
+        self._in_flight = threading.BoundedSemaphore(max(1, max_in_flight or WRITE_MAX_IN_FLIGHT))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._error = None
+        self._threads = []
+        self.stats = {'rows': 0, 'deleted': 0, 'unchanged': 0, 'batches': 0, 'throttles': 0, 'retries': 0}
+        self._started_at = None
+
+    def __enter__(self):
+        self._started_at = time.monotonic()
+        for n in range(self.concurrency):
+            thread = threading.Thread(target=self._worker, name=f"ddb-writer-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+        if exc_type is None and self._error:
+            raise self._error
+        return False
+
+    def put_item(self, item):
+        self._add({'PutRequest': {'Item': item}}, item)
+
+    def delete_item(self, key):
+        self._add({'DeleteRequest': {'Key': key}}, key)
+
+    def update_count(self, item):
+        """Como put_item, pero la fila solo se escribe si es nueva o cambia (ver _update_count)."""
+        self._add({'UpdateCount': item}, item)
+
+    def _add(self, request, item):
+        if self._error:
+            raise self._error
+        # BatchWriteItem rechaza claves repetidas en el mismo lote:
+        # si la clave ya está pendiente, gana la última.
+        key = tuple(item[k] for k in KEY_ATTRIBUTES)
+        self._pending[key] = request
+        if len(self._pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Encola el lote pendiente (bloquea si hay demasiados en vuelo)."""
+        if not self._pending:
+            return
+        requests = list(self._pending.values())
+        self._pending = {}
+        self._in_flight.acquire()
+        self._queue.put(requests)
+
+    def _worker(self):
+        while True:
+            requests = self._queue.get()
+            if requests is None:
+                return
+            try:
+                if not self._error:
+                    self._write_batch(requests)
+            except Exception as e:
+                logger.error("Error escribiendo lote en DynamoDB: %s", e)
+                with self._lock:
+                    self._error = self._error or e
+            finally:
+                self._in_flight.release()
+
+    def _write_batch(self, requests):
+        updates = [r['UpdateCount'] for r in requests if 'UpdateCount' in r]
+        if updates:
+            requests = [r for r in requests if 'UpdateCount' not in r]
+            written = sum(1 for item in updates if self._update_count(item))
+            with self._lock:
+                self.stats['rows'] += written
+                self.stats['unchanged'] += len(updates) - written
+                if not requests:
+                    self.stats['batches'] += 1
+            if not requests:
+                return
+        attempt = 0
+        deletes = sum(1 for r in requests if 'DeleteRequest' in r)
+        puts = len(requests) - deletes
+        while requests:
+            try:
+                response = self.client.batch_write_item(RequestItems={self.table_name: requests})
+                requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            except ClientError as e:
+                if e.response['Error']['Code'] not in THROTTLING_ERRORS:
+                    raise
+            else:
+                if not requests:
+                    break
+            with self._lock:
+                self.stats['throttles'] += 1
+                self.stats['retries'] += 1
+            attempt += 1
+            if attempt > self.max_retries:
+                raise RuntimeError(
+                    f"{len(requests)} items sin procesar tras {self.max_retries} reintentos"
+                )
+            # Backoff exponencial con "full jitter"
+            time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+        with self._lock:
+            self.stats['rows'] += puts
+            self.stats['deleted'] += deletes
+            self.stats['batches'] += 1
+
+    def _update_count(self, item):
+        """
+        UpdateItem condicional: escribe Count, LowStock y la marca UpdatedAt
+        solo si la fila es nueva, cambia su Count o su LowStock no corresponde
+        al Count. Si no, la condición falla, la fila queda igual y no hay
+        registro en el stream. Devuelve True si se ha escrito.
+        """
+        values = {':c': item['Count'], ':at': item['UpdatedAt'], ':b': item['UpdatedBucket']}
+        expression = "SET #c = :c, UpdatedAt = :at, UpdatedBucket = :b"
+        if LOW_STOCK_ATTRIBUTE in item:
+            values[':low'] = item[LOW_STOCK_ATTRIBUTE]
+            expression += f", {LOW_STOCK_ATTRIBUTE} = :low"
+            low_stock_stale = f"attribute_not_exists({LOW_STOCK_ATTRIBUTE})"
+        else:
+            expression += f" REMOVE {LOW_STOCK_ATTRIBUTE}"
+            low_stock_stale = f"attribute_exists({LOW_STOCK_ATTRIBUTE})"
+        attempt = 0
+        while True:
+            try:
+                self.client.update_item(
+                    TableName=self.table_name,
+                    Key={name: item[name] for name in KEY_ATTRIBUTES},
+                    UpdateExpression=expression,
+                    ConditionExpression=f"attribute_not_exists(#c) OR #c <> :c OR {low_stock_stale}",
+                    ExpressionAttributeNames={'#c': 'Count'}, # 'Count' es palabra reservada
+                    ExpressionAttributeValues=values
+                )
+                return True
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code == 'ConditionalCheckFailedException':
+                    return False
+                if code not in THROTTLING_ERRORS:
+                    raise
+            with self._lock:
+                self.stats['throttles'] += 1
+                self.stats['retries'] += 1
+            attempt += 1
+            if attempt > self.max_retries:
+                raise RuntimeError(f"UpdateItem sin procesar tras {self.max_retries} reintentos")
+            time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+    def report(self):
+        """Devuelve las estadísticas de escritura (filas/s, throttles...)."""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        with self._lock:
+            stats = dict(self.stats)
+        stats['seconds'] = round(elapsed, 3)
+        stats['rows_per_second'] = round(stats['rows'] / elapsed, 1) if elapsed else 0.0
+        return stats
+
+class SeenKeys:
+    """Claves (tienda lógica, Item) que aparecen en una pasada (modo 'snapshot')."""
+    def __init__(self):
+        self._seen = {}
+
+    def add(self, item):
+        self._seen.setdefault(item['Store'], set()).add(item['Item'])
+
+    def __contains__(self, key):
+        store, item = key
+        return item in self._seen.get(store, ())
+
+    def seen_keys(self):
+        """Las claves vistas, ordenadas (así las mezcla el barrido final)."""
+        for store in sorted(self._seen):
+            for item in sorted(self._seen[store]):
+                yield store, item
+
+class InventoryDiff:
+    """
+    Compara las filas del fichero con lo que ya hay en DynamoDB.
+    La primera vez que aparece una tienda se leen sus filas actuales con
+    un Query paginado (solo Item y Count); después todo es en memoria.
+    Solo lo usan los modos 'diff' y 'snapshot'.
+    """
+    def __init__(self, track_seen=False):
+        self.seen = SeenKeys() if track_seen else None
+        self._current = {}
+
+    def _load_store(self, store):
+        current = {}
+        # Una tienda repartida se lee partición a partición
+        for partition in store_partitions(store):
+            params = {
+                'KeyConditionExpression': Key('Store').eq(partition),
+                'ProjectionExpression': '#i, #c',
+                'ExpressionAttributeNames': {'#i': 'Item', '#c': 'Count'} # 'Count' es palabra reservada
+            }
+            while True:
+                response = table.query(**params)
+                for row in response.get('Items', []):
+                    current[row['Item']] = row.get('Count')
+                if 'LastEvaluatedKey' not in response:
+                    break
+                params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        logger.info("Leídas %d filas actuales de la tienda %s.", len(current), store)
+        self._current[store] = current
+        return current
+
+    def is_changed(self, item):
+        """
+        True si la fila es nueva o su Count es distinto del guardado. Lo que
+        se va a escribir pasa a ser lo guardado: una repetición lejana (con
+        'last') se compara con la fila ya escrita, no con la de antes de la carga.
+        """
+        store = item['Store']
+        current = self._current.get(store)
+        if current is None:
+            current = self._load_store(store)
+        if self.seen is not None:
+            self.seen.add(item)
+        if item['Item'] in current and current[item['Item']] == item['Count']:
+            return False
+        current[item['Item']] = item['Count']
+        return True
+
+    def missing_keys(self):
+        """Claves (físicas) de las tiendas del fichero que no aparecen en él."""
+        for store, current in self._current.items():
+            for item in current:
+                if (store, item) not in self.seen:
+                    yield {'Store': shard_key(store, item), 'Item': item}
+
+def delta_source(bucket_name, object_key, etag, version=None):
+    """
+    Identificador corto de una subida del objeto (marcas de idempotencia de
+    los deltas). 'version' es el versionId o, sin versionado, el sequencer
+    del evento de S3: dos subidas con el mismo contenido (A, A o A, B, A)
+    son distintas y se suman las dos.
+    """
+    etag = (etag or '').strip('"')
+    source = f"{bucket_name}/{object_key}@{etag}"
+    if version:
+        source += f"#{version}"
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
+
+def is_delta_object(bucket_name, object_key, etag, fmt):
+    """True si el objeto es un fichero de deltas (solo se lee el primer registro)."""
+    records = RecordStream(fmt, bucket_name, object_key, etag=etag)
+    rows = iter(records)
+    try:
+        row = next(rows, None)
+    finally:
+        rows.close()
+    if row is None:
+        return False
+    parse_row = records.row_parser()
+    parse_row(row)
+    return parse_row.is_delta
+
+class DeltaApplier:
+    """
+    Acumula los deltas de un fichero por (Store, Item) y después los aplica
+    con ADD Count en un pool de hilos: una sola escritura por clave en cada
+    ventana de filas. ADD es conmutativo, así que cargas concurrentes no se pisan.
+    Con 'source' (ver delta_source) cada apply(position) es idempotente:
+    los tramos de DELTA_TRANSACT_KEYS claves se escriben con
+    TransactWriteItems junto con su marca en la tabla de estado, y si la
+    marca ya existe el tramo no se vuelve a sumar. Sin 'source' se usa un
+    UpdateItem por clave (repeticiones lejanas de 'sum', cuyas filas se
+    reescriben de todos modos si la pasada se repite).
+    """
+    def __init__(self, table_name, source=None, concurrency=None, max_retries=None):
+        self.table_name = table_name
+        self.source = source
+        self.concurrency = max(1, concurrency or WRITE_CONCURRENCY)
+        self.max_retries = max_retries if max_retries is not None else WRITE_MAX_RETRIES
+        self.client = dynamodb.meta.client
+        self.deltas = {}
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self.stats = {'rows': 0, 'skipped': 0, 'replayed': 0, 'throttles': 0}
+
+    def add(self, item):
+        key = (item["Store"], item["Item"])
+        if key in self.deltas:
+            self.duplicates += 1
+            self.deltas[key] += item["Count"]
+        else:
+            self.deltas[key] = item["Count"]
+
+    def apply(self, position=None):
+        """
+        Aplica los deltas acumulados (los que suman 0 no se escriben).
+        'position' es dónde empieza la ventana de filas acumulada; con
+        'source' forma parte de las marcas, así que una misma ventana debe
+        contener siempre las mismas filas.
+        """
+        # Ordenados: un reintento reparte las claves en los mismos tramos
+        pending = sorted((key, delta) for key, delta in self.deltas.items() if delta)
+        self.stats['skipped'] += len(self.deltas) - len(pending)
+        self.deltas = {}
+        if not pending:
+            return
+        if self.source is None:
+            tasks, work = pending, self._update
+        else:
+            tasks = [
+                (f"delta#{self.source}#{position}#{n}", pending[i:i + DELTA_TRANSACT_KEYS])
+                for n, i in enumerate(range(0, len(pending), DELTA_TRANSACT_KEYS))
+            ]
+            work = self._apply_chunk
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for _ in pool.map(work, tasks):
+                pass
+
+    @staticmethod
+    def _update_action(store, item, delta, updated_at, bucket):
+        return {
+            'Key': {'Store': shard_key(store, item), 'Item': item},
+            'UpdateExpression': "ADD #c :delta SET UpdatedAt = :now, UpdatedBucket = :bucket",
+            'ExpressionAttributeNames': {'#c': 'Count'}, # 'Count' es palabra reservada
+            'ExpressionAttributeValues': {':delta': delta, ':now': updated_at, ':bucket': bucket}
+        }
+
+    def _apply_chunk(self, task):
+        """Un tramo de claves en una transacción con su marca (solo si la marca no existe)."""
+        marker, chunk = task
+        updated_at, bucket = updated_stamp()
+        actions = [{'Put': {
+            'TableName': STATE_TABLE_NAME,
+            'Item': {'StateKey': marker, 'CreatedAt': updated_at, 'ExpiresAt': updated_at + STATE_TTL_SECONDS},
+            'ConditionExpression': "attribute_not_exists(StateKey)"
+        }}]
+        for (store, item), delta in chunk:
+            actions.append({'Update': dict(
+                self._update_action(store, item, delta, updated_at, bucket), TableName=self.table_name
+            )})
+        try:
+            self._call('transact_write_items', TransactItems=actions)
+        except ClientError as e:
+            reasons = [r.get('Code') for r in e.response.get('CancellationReasons', [])]
+            if not reasons or reasons[0] != 'ConditionalCheckFailed':
+                raise
+            logger.info("Deltas %s ya aplicados en un intento anterior: no se vuelven a sumar.", marker)
+            with self._lock:
+                self.stats['replayed'] += len(chunk)
+        else:
+            with self._lock:
+                self.stats['rows'] += len(chunk)
+        # También si ya estaban aplicados: el intento anterior pudo caerse antes de corregir LowStock
+        keys = [{'Store': shard_key(store, item), 'Item': item} for (store, item), _ in chunk]
+        for key, updated in self._read(keys):
+            self._sync_low_stock(key, updated)
+
+    def _read(self, keys):
+        """(clave, item) de las claves tras aplicar el tramo (BatchGetItem, hasta 100 claves)."""
+        request = {
+            'Keys': keys,
+            'ProjectionExpression': '#s, #i, #c, #low',
+            'ExpressionAttributeNames': {'#s': 'Store', '#i': 'Item', '#c': 'Count', '#low': LOW_STOCK_ATTRIBUTE}
+        }
+        attempt = 0
+        while request:
+            response = self._call('batch_get_item', RequestItems={self.table_name: request})
+            for row in response.get('Responses', {}).get(self.table_name, []):
+                yield {'Store': row['Store'], 'Item': row['Item']}, row
+            request = response.get('UnprocessedKeys', {}).get(self.table_name)
+            if request:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise RuntimeError(f"{len(request['Keys'])} claves sin leer tras {self.max_retries} reintentos")
+                time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+    def _update(self, entry):
+        (store, item), delta = entry
+        updated_at, bucket = updated_stamp()
+        action = self._update_action(store, item, delta, updated_at, bucket)
+        key = action['Key']
+        updated = self._call(
+            'update_item',
+            TableName=self.table_name,
+            ReturnValues='ALL_NEW',
+            **action
+        )['Attributes']
+        self._sync_low_stock(key, updated)
+        with self._lock:
+            self.stats['rows'] += 1
+
+
+    def _sync_low_stock(self, key, updated):
+        """
+        ADD no puede decidir LowStock según el Count resultante: si la marca
+        no corresponde al nuevo Count se corrige con un segundo UpdateItem,
+        condicionado a ese Count (si otra carga lo ha cambiado, esa carga
+        corrige la marca).
+        """
+        count = updated['Count']
+        is_low = count < LOW_STOCK_THRESHOLD
+        if is_low == (LOW_STOCK_ATTRIBUTE in updated):
+            return
+        kwargs = {
+            'TableName': self.table_name,
+            'Key': key,
+            'ConditionExpression': "#c = :count",
+            'ExpressionAttributeNames': {'#c': 'Count', '#low': LOW_STOCK_ATTRIBUTE},
+            'ExpressionAttributeValues': {':count': count},
+        }
+        if is_low:
+            kwargs['UpdateExpression'] = "SET #low = :store"
+            kwargs['ExpressionAttributeValues'][':store'] = logical_store(key['Store'])
+        else:
+            kwargs['UpdateExpression'] = "REMOVE #low"
+        try:
+            self._call('update_item', **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    def _call(self, operation, **kwargs):
+        """Llamada a DynamoDB con reintentos (backoff con jitter) ante throttling o conflictos."""
+        attempt = 0
+        while True:
+            try:
+                return getattr(self.client, operation)(**kwargs)
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                reasons = [r.get('Code') for r in e.response.get('CancellationReasons', [])]
+                retry = code in THROTTLING_ERRORS or (
+                    code == 'TransactionCanceledException'
+                    and 'ConditionalCheckFailed' not in reasons
+                    and any(reason in TRANSACTION_RETRY_REASONS for reason in reasons)
+                )
+                if not retry:
+                    raise
+                with self._lock:
+                    self.stats['throttles'] += 1
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+def ingest_object(bucket_name, object_key, start=0, end=None, fieldnames=None, etag=None,
+                  should_stop=None, mode=INGEST_MODE_FULL, delete_missing=False, fmt=('csv', None),
+                  track_seen=False, preload=True, version=None):
+    """
+    Lee (en streaming) el objeto o el rango de bytes [start, end) y lo
+    carga en DynamoDB.
+    Si 'should_stop()' devuelve True se deja de leer en un límite de fila,
+    se esperan las escrituras pendientes y se devuelve la posición alcanzada
+    para poder continuar desde ahí.
+    En modo 'diff'/'snapshot' se omiten las filas sin cambios y, si
+    'delete_missing', se borran las filas que faltan en el fichero. Sin
+    'preload' (un rango o una continuación) no se leen antes las tiendas: las
+    filas se escriben como en 'full', con la escritura condicional. Con
+    'track_seen' el resultado lleva en 'seen' las claves vistas (SeenKeys;
+    None en un fichero de deltas).
+    Los ficheros de deltas se agregan por clave y se aplican con ADD cada
+    DELTA_FLUSH_ROWS filas; solo se para al cerrar una de esas ventanas, así
+    que las ventanas (y sus marcas de idempotencia) son siempre las mismas.
+    'version' identifica la subida en esas marcas (ver delta_source).
+    El resultado incluye las tiendas que aparecen ('stores'), cuyos
+    snapshots hay que volver a publicar.
+    """
+    records = RecordStream(fmt, bucket_name, object_key, start, end, fieldnames, etag)
+    finished = True
+    # Solo 'diff'/'snapshot' sobre el fichero completo leen antes las filas de
+    # cada tienda; 'full' y los rangos no guardan la tabla en memoria y dejan
+    # que la escritura condicional decida (los rangos solo anotan sus claves)
+    diff = None
+    if mode != INGEST_MODE_FULL and preload:
+        diff = InventoryDiff(track_seen=delete_missing or track_seen)
+    seen = diff.seen if diff is not None else (SeenKeys() if track_seen else None)
+    skipped = 0
+    # Los lotes de 25 se reparten entre varios hilos escritores,
+    # así que las primeras escrituras empiezan antes de terminar la descarga.
+    writer = ParallelBatchWriter(TABLE_NAME)
+
+    def emit(item):
+        nonlocal skipped
+        if diff is None:
+            # UpdatedAt solo cambia si cambia el Count: una fila igual no se
+            # escribe y no genera registro en el stream (ni alertas ni ?since=)
+            if seen is not None:
+                seen.add(item)
+            writer.update_count(stamp_updated(shard_item(mark_low_stock(item))))
+        elif diff.is_changed(item):
+            writer.put_item(stamp_updated(shard_item(mark_low_stock(item))))
+        else:
+            skipped += 1
+
+    # Repeticiones lejanas con 'sum': se suman con ADD cuando ya está escrita
+    # la primera fila (al salir del 'with', ver más abajo)
+    late_sums = DeltaApplier(TABLE_NAME)
+    aggregator = KeyAggregator(emit, emit_late=late_sums.add)
+    deltas = DeltaApplier(TABLE_NAME)
+    parse_row = None
+    add = aggregator.add
+    stores = set()
+    is_delta = False
+    window_start = records.position
+    with writer:
+        for n, row in enumerate(records, 1):
+            item = None
+            if parse_row is None:
+                parse_row = records.row_parser()
+                item = parse_row(row)
+                if parse_row.is_delta:
+                    logger.info("s3://%s/%s es un fichero de deltas: se aplicará ADD por clave.", bucket_name, object_key)
+                    is_delta = True
+                    add = deltas.add
+                    deltas.source = delta_source(bucket_name, object_key, records.etag, version)
+                    if mode != INGEST_MODE_FULL:
+                        logger.warning("Modo '%s' ignorado: los deltas se aplican siempre con ADD.", mode)
+            else:
+                item = parse_row(row)
+            if item:
+                stores.add(item['Store'])
+                add(item)
+            if is_delta:
+                if n % DELTA_FLUSH_ROWS == 0:
+                    deltas.apply(window_start)
+                    window_start = records.position
+                    if should_stop and should_stop():
+                        finished = False
+                        break
+            elif should_stop and n % CHECKPOINT_CHECK_ROWS == 0 and should_stop():
+                finished = False
+                break
+        aggregator.flush()
+        deltas.apply(window_start)
+        if finished and delete_missing and diff is not None and not is_delta:
+            for key in diff.missing_keys():
+                writer.delete_item(key)
+
+    # Al salir del 'with' todas las filas anteriores a 'offset' están escritas
+    late_sums.apply()
+    if deltas.stats['replayed']:
+        logger.warning("%d deltas ya aplicados en un intento anterior; no se han vuelto a sumar.",
+                       deltas.stats['replayed'])
+    if aggregator.late_duplicates:
+        logger.warning(
+            "%d filas repetidas fuera de la ventana de %d claves (política '%s').",
+            aggregator.late_duplicates, aggregator.window, aggregator.policy
+        )
+    result = writer.report()
+    result['rows'] += deltas.stats['rows']
+    result['throttles'] += deltas.stats['throttles'] + late_sums.stats['throttles']
+    if result['seconds']:
+        result['rows_per_second'] = round(result['rows'] / result['seconds'], 1)
+    result.update({
+        'concurrency': writer.concurrency,
+        'skipped': skipped + writer.stats['unchanged'] + deltas.stats['skipped'],
+        'duplicates': aggregator.duplicates + deltas.duplicates,
+        'offset': records.position,
+        'finished': finished,
+        'fieldnames': records.fieldnames,
+        'etag': records.etag,
+        'stores': stores,
+        'seen': seen if track_seen and not is_delta else None
+    })
+    return result
+
+def read_range(bucket_name, object_key, etag, start, end):
+    """Lee los bytes [start, end) del objeto."""
+    response = s3_client.get_object(
+        Bucket=bucket_name, Key=object_key, IfMatch=etag, Range=f"bytes={start}-{end - 1}"
+    )
+    return response['Body'].read()
+
+def find_line_start(bucket_name, object_key, etag, offset, size):
+    """
+    Devuelve la posición del primer inicio de línea en o después de 'offset'
+    leyendo solo pequeños trozos alrededor de esa posición.
+    """
+    position = offset - 1 # Si offset ya es inicio de línea, el byte anterior es '\n'
+    while position < size:
+        end = min(size, position + NEWLINE_PROBE_BYTES)
+        newline = read_range(bucket_name, object_key, etag, position, end).find(b"\n")
+        if newline >= 0:
+            return position + newline + 1
+        position = end
+    return size
+
+def plan_ranges(bucket_name, object_key, etag, size, has_header=True):
+    """
+    Lee la cabecera (si la hay) y divide el resto del fichero en rangos de
+    bytes alineados con saltos de línea. Nota: asume que los campos del CSV
+    no contienen saltos de línea entre comillas.
+    """
+    header_end, fieldnames = 0, None
+    if has_header:
+        header_end = find_line_start(bucket_name, object_key, etag, 1, size)
+        header_line = read_range(bucket_name, object_key, etag, 0, header_end).decode('utf-8')
+        fieldnames = next(csv.reader([header_line]), [])
+
+    data_size = size - header_end
+    range_bytes = max(FANOUT_RANGE_BYTES, math.ceil(data_size / FANOUT_MAX_RANGES))
+    boundaries = [header_end]
+    nominal = header_end + range_bytes
+    while nominal < size:
+        aligned = find_line_start(bucket_name, object_key, etag, nominal, size)
+        if aligned >= size:
+            break
+        boundaries.append(aligned)
+        nominal = aligned + range_bytes
+    boundaries.append(size)
+    ranges = [(a, b) for a, b in zip(boundaries, boundaries[1:]) if b > a]
+    return fieldnames, ranges
+
+class UploadInProgress(Exception):
+    """Otra invocación viva tiene reclamada la subida (hay que reintentar más tarde)."""
+
+def claim_upload(bucket_name, object_key, etag, size, request_id, version=None, per_upload=False):
+    """
+    Registra la subida en el manifiesto. Devuelve la referencia al manifiesto
+    o None si ese mismo contenido (ETag + tamaño) ya se ingirió. Si otra
+    invocación lo está ingiriendo y su lease sigue vivo lanza
+    UploadInProgress. Un reintento asíncrono de Lambda llega con el mismo
+    request id y puede volver a reclamar su propia reclamación.
+    Con 'per_upload' (ficheros de deltas) solo es un duplicado la misma
+    subida ('version': versionId o sequencer del evento), no el mismo contenido.
+    """
+    now = int(time.time())
+    manifest = {'state_key': f"manifest#{bucket_name}/{object_key}", 'etag': etag}
+    values = {
+        ':etag': etag,
+        ':size': size,
+        ':processing': 'PROCESSING',
+        ':failed': 'FAILED',
+        ':now': now,
+        ':stale': now - DEDUP_LEASE_SECONDS,
+        ':req': request_id
+    }
+    expression = "SET ETag = :etag, #size = :size, #s = :processing, ClaimedAt = :now, RequestId = :req"
+    condition = "attribute_not_exists(StateKey) OR ETag <> :etag OR #size <> :size"
+    if version:
+        manifest['version'] = version
+        values[':version'] = version
+        expression += ", UploadVersion = :version REMOVE CompletedAt"
+        if per_upload:
+            condition += " OR attribute_not_exists(UploadVersion) OR UploadVersion <> :version"
+    else:
+        expression += " REMOVE CompletedAt, UploadVersion"
+    condition += " OR #s = :failed OR (#s = :processing AND (ClaimedAt < :stale OR RequestId = :req))"
+    try:
+        state_table.update_item(
+            Key={'StateKey': manifest['state_key']},
+            UpdateExpression=expression,
+            ConditionExpression=condition,
+            ExpressionAttributeNames={'#s': 'Status', '#size': 'Size'},
+            ExpressionAttributeValues=values,
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        # El item viene en formato de DynamoDB ({"S": ...}) aunque se use el recurso
+        old = e.response.get('Item', {})
+        if old.get('Status', {}).get('S') == 'PROCESSING':
+            raise UploadInProgress(
+                f"s3://{bucket_name}/{object_key} lo está cargando {old.get('RequestId', {}).get('S')}"
+            )
+        return None
+    return manifest
+
+def manifest_condition(manifest):
+    """Condición (y valores) de que el manifiesto sigue apuntando a nuestra subida."""
+    values = {':etag': manifest['etag']}
+    if manifest.get('version'):
+        values[':version'] = manifest['version']
+        return "ETag = :etag AND UploadVersion = :version", values
+    return "ETag = :etag", values
+
+def renew_claim(manifest):
+    """
+    Renueva el lease de la reclamación (ClaimedAt = ahora) mientras la carga
+    avanza, para que no se tome por abandonada. Si ya no es nuestra (otra
+    versión del objeto o reclamación caducada y retomada) solo se avisa.
+    """
+    if not manifest:
+        return
+    condition, values = manifest_condition(manifest)
+    values.update({':now': int(time.time()), ':processing': 'PROCESSING'})
+    try:
+        state_table.update_item(
+            Key={'StateKey': manifest['state_key']},
+            UpdateExpression="SET ClaimedAt = :now",
+            ConditionExpression=f"{condition} AND #s = :processing",
+            ExpressionAttributeNames={'#s': 'Status'},
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        logger.warning("La reclamación de %s ya no está en curso; no se renueva.", manifest['state_key'])
+
+def finish_upload(manifest, status, rows=None):
+    """Marca la subida del manifiesto como DONE o FAILED."""
+    if not manifest:
+        return
+    condition, values = manifest_condition(manifest)
+    values.update({':status': status, ':now': int(time.time())})
+    expression = "SET #s = :status, CompletedAt = :now"
+    if rows is not None:
+        expression += ", RowsWritten = :rows"
+        values[':rows'] = rows
+    try:
+        state_table.update_item(
+            Key={'StateKey': manifest['state_key']},
+            UpdateExpression=expression,
+            # Si entretanto se ha subido otra versión, no la pisamos
+            ConditionExpression=condition,
+            ExpressionAttributeNames={'#s': 'Status'},
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        logger.warning("El manifiesto %s ya apunta a otra versión del objeto.", manifest['state_key'])
+
+def bump_inventory_version():
+    """
+    Incrementa la versión del inventario (invalida la caché de la API) y
+    devuelve la nueva, o None si no se pudo actualizar.
+    """
+    try:
+        response = state_table.update_item(
+            Key={'StateKey': INVENTORY_VERSION_KEY},
+            UpdateExpression="ADD Version :one SET UpdatedAt = :now",
+            ExpressionAttributeValues={':one': 1, ':now': int(time.time())},
+            ReturnValues='UPDATED_NEW'
+        )
+    except ClientError as e:
+        # La carga ya está hecha: como mucho la API sirve datos viejos hasta el TTL
+        logger.warning("No se pudo actualizar la versión del inventario: %s", e)
+        return None
+    return int(response['Attributes']['Version'])
+
+def inventory_version():
+    """Versión actual del inventario (0 si todavía no hay ninguna)."""
+    item = state_table.get_item(Key={'StateKey': INVENTORY_VERSION_KEY}, ConsistentRead=True).get('Item')
+    return int(item['Version']) if item else 0
+
+def snapshot_pointer_key(store):
+    """StateKey del item que apunta a la generación publicada (global si store es None)."""
+    return f"{SNAPSHOT_POINTER_PREFIX}all" if store is None else f"{SNAPSHOT_POINTER_PREFIX}store#{store}"
+
+def snapshot_prefix(store, generation):
+    """Prefijo S3 de una generación del snapshot (el nombre de la tienda va url-encoded)."""
+    name = 'all' if store is None else f"stores/{quote(store, safe='')}"
+    return f"{SNAPSHOT_PREFIX}{name}/{generation}/"
+
+def json_number(value):
+    """json.dumps no sabe serializar Decimal (los números de DynamoDB)."""
+    if isinstance(value, Decimal):
+        return int(value) if value % 1 == 0 else float(value)
+    raise TypeError(f"{type(value).__name__} no es serializable")
+
+def scan_inventory_pages():
+    """
+    Scan paralelo de la tabla completa (WRITE_CONCURRENCY segmentos): genera
+    las páginas según llegan. La cola acotada limita la memoria.
+    """
+    segments = max(1, WRITE_CONCURRENCY)
+    pages = queue.Queue(maxsize=segments * 2)
+    stop = threading.Event()
+
+    def scan_segment(segment):
+        kwargs = {'Segment': segment, 'TotalSegments': segments}
+        try:
+            while not stop.is_set():
+                response = table.scan(**kwargs)
+                pages.put(response.get('Items', []))
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        finally:
+            pages.put(None)
+
+    pending = segments
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        futures = [pool.submit(scan_segment, segment) for segment in range(segments)]
+        try:
+            while pending:
+                items = pages.get()
+                if items is None:
+                    pending -= 1
+                elif items:
+                    yield items
+        finally:
+            stop.set()
+            # Vaciar la cola para que ningún hilo se quede bloqueado en put()
+            while any(not future.done() for future in futures):
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        for future in futures:
+            future.result()
+
+def store_rows(store, keys_only=False):
+    """Filas de una tienda ordenadas por Item (mezcla las particiones si está repartida)."""
+    def partition_rows(partition):
+        params = {'KeyConditionExpression': Key('Store').eq(partition)}
+        if keys_only:
+            params.update(ProjectionExpression='#i', ExpressionAttributeNames={'#i': 'Item'})
+        while True:
+            response = table.query(**params)
+            for row in response.get('Items', []):
+                row['Store'] = store
+                yield row
+            if 'LastEvaluatedKey' not in response:
+                return
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    return heapq.merge(*(partition_rows(p) for p in store_partitions(store)), key=lambda row: row['Item'])
+
+class SnapshotWriter:
+    """
+    Escribe una generación de un snapshot bajo 'prefix': full.json.gz
+    ({"items": [...], "next_cursor": null, "generated_at": n}), comprimido
+    con gzip según llegan los items, y las páginas part-<n>.json.gz de
+    SNAPSHOT_PAGE_ROWS filas. Solo guarda en memoria la parte y la página en
+    curso; si todo cabe en una parte usa un PutObject. Si algo falla se
+    aborta el multipart, se borra lo subido y queda la generación anterior.
+    Al cerrar, 'etag' es el ETag de full.json.gz y 'pages' cuántas páginas hay.
+    """
+    def __init__(self, prefix, generated_at):
+        self.prefix = prefix
+        self.key = f"{prefix}full.json.gz"
+        self.generated_at = generated_at
+        self.items = 0
+        self.pages = 0
+        self.etag = None
+        # wbits=31: salida con cabecera y cola gzip (ContentEncoding: gzip)
+        self._compressor = zlib.compressobj(SNAPSHOT_GZIP_LEVEL, zlib.DEFLATED, 31)
+        self._buffer = bytearray()
+        self._parts = []
+        self._upload_id = None
+        self._page = []
+        self._write('{"items":[')
+
+    def write(self, items):
+        if not items:
+            return
+        encoded = [json.dumps(item, default=json_number, separators=(',', ':')) for item in items]
+        self._write((',' if self.items else '') + ','.join(encoded))
+        self.items += len(items)
+        for text in encoded:
+            self._page.append(text)
+            if len(self._page) == SNAPSHOT_PAGE_ROWS:
+                self._upload_page()
+
+    def _upload_page(self):
+        text = f'{{"items":[{",".join(self._page)}],"generated_at":{self.generated_at}}}'
+        s3_client.put_object(
+            Bucket=SNAPSHOT_BUCKET, Key=f"{self.prefix}part-{self.pages}.json.gz",
+            Body=gzip.compress(text.encode('utf-8'), compresslevel=SNAPSHOT_GZIP_LEVEL),
+            ContentType='application/json', ContentEncoding='gzip'
+        )
+        self.pages += 1
+        self._page = []
+
+    def _write(self, text):
+        self._buffer += self._compressor.compress(text.encode('utf-8'))
+        if len(self._buffer) >= SNAPSHOT_PART_BYTES:
+            self._upload_part()
+
+    def _upload_part(self):
+        if self._upload_id is None:
+            self._upload_id = s3_client.create_multipart_upload(
+                Bucket=SNAPSHOT_BUCKET, Key=self.key,
+                ContentType='application/json', ContentEncoding='gzip'
+            )['UploadId']
+        number = len(self._parts) + 1
+        etag = s3_client.upload_part(
+            Bucket=SNAPSHOT_BUCKET, Key=self.key, UploadId=self._upload_id,
+            PartNumber=number, Body=bytes(self._buffer)
+        )['ETag']
+        self._parts.append({'PartNumber': number, 'ETag': etag})
+        self._buffer = bytearray()
+
+    def close(self):
+        if self._page:
+            self._upload_page()
+        self._buffer += self._compressor.compress(
+            f'],"next_cursor":null,"generated_at":{self.generated_at}}}'.encode('utf-8')
+        )
+        self._buffer += self._compressor.flush()
+        if self._upload_id is None:
+            self.etag = s3_client.put_object(
+                Bucket=SNAPSHOT_BUCKET, Key=self.key, Body=bytes(self._buffer),
+                ContentType='application/json', ContentEncoding='gzip'
+            )['ETag']
+            return
+        self._upload_part()
+        self.etag = s3_client.complete_multipart_upload(
+            Bucket=SNAPSHOT_BUCKET, Key=self.key, UploadId=self._upload_id,
+            MultipartUpload={'Parts': self._parts}
+        )['ETag']
+
+    def abort(self):
+        if self._upload_id is not None:
+            s3_client.abort_multipart_upload(Bucket=SNAPSHOT_BUCKET, Key=self.key, UploadId=self._upload_id)
+        delete_snapshot_generation(self.prefix)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def delete_snapshot_generation(prefix):
+    """Borra los objetos de una generación del snapshot (full.json.gz y sus páginas)."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=SNAPSHOT_BUCKET, Prefix=prefix):
+        keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+        if keys:
+            s3_client.delete_objects(Bucket=SNAPSHOT_BUCKET, Delete={'Objects': keys, 'Quiet': True})
+
+def switch_snapshot(store, writer, version):
+    """
+    Apunta el snapshot a la generación recién escrita ('writer' ya cerrado)
+    y borra la anterior. Sin 'writer' (tienda sin filas) quita el snapshot.
+    Solo si 'version' (la del inventario al terminar la carga) no es menor
+    que la publicada: una tarea más antigua que acaba tarde no pisa un
+    snapshot más reciente y borra lo que había escrito. Devuelve si se publicó.
+    Un cliente que estaba paginando la anterior recibe 400 y vuelve a empezar.
+    """
+    key = {'StateKey': snapshot_pointer_key(store)}
+    guard = {
+        'ConditionExpression': "attribute_not_exists(StateKey) OR attribute_not_exists(Version) OR Version <= :v",
+        'ExpressionAttributeValues': {':v': version},
+        'ReturnValues': 'ALL_OLD'
+    }
+    try:
+        if writer is None:
+            old = state_table.delete_item(Key=key, **guard).get('Attributes')
+        else:
+            old = state_table.put_item(Item=dict(
+                key,
+                Prefix=writer.prefix,
+                ETag=writer.etag,
+                ItemCount=writer.items,
+                Pages=writer.pages,
+                PageRows=SNAPSHOT_PAGE_ROWS,
+                GeneratedAt=writer.generated_at,
+                Version=version
+            ), **guard).get('Attributes')
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        logger.info("Ya hay publicado un snapshot más reciente que la versión %d de %s.", version, key['StateKey'])
+        if writer is not None:
+            delete_snapshot_generation(writer.prefix)
+        return False
+    if old:
+        delete_snapshot_generation(old['Prefix'])
+    return True
+
+def write_snapshot(store, pages, generated_at, version):
+    """Escribe una generación nueva con las páginas de items y la publica (ver switch_snapshot)."""
+    generation = f"{version}-{generated_at}-{uuid.uuid4().hex[:8]}"
+    with SnapshotWriter(snapshot_prefix(store, generation), generated_at) as writer:
+        for items in pages:
+            writer.write(items)
+    switch_snapshot(store, writer, version)
+    return writer.items
+
+def publish_store_snapshot(store, generated_at, version):
+    """Reescribe el snapshot de una tienda; si ya no tiene filas, lo quita."""
+    rows = store_rows(store)
+    first = list(islice(rows, SNAPSHOT_PAGE_ROWS))
+    if not first:
+        switch_snapshot(store, None, version)
+        return 0
+    pages = iter(lambda: list(islice(rows, SNAPSHOT_PAGE_ROWS)), [])
+    return write_snapshot(store, chain([first], pages), generated_at, version)
+
+def global_snapshot_pages():
+    """Páginas del Scan paralelo con la tienda lógica (el snapshot no muestra las particiones)."""
+    for items in scan_inventory_pages():
+        for item in items:
+            item['Store'] = logical_store(item['Store'])
+        yield items
+
+def publish_snapshots(stores, version):
+    """
+    Materializa el inventario en S3 tras una carga: el snapshot global
+    (Scan paralelo, en el orden en que llegan las páginas) y el de cada
+    tienda de 'stores' (las que aparecen en la carga; las demás no han
+    cambiado), con la versión del inventario de esa carga. Es best-effort:
+    un fallo aquí no invalida la carga (la API vuelve a DynamoDB o sirve el
+    snapshot anterior).
+    """
+    if not SNAPSHOT_BUCKET:
+        return
+    started = time.perf_counter()
+    generated_at = int(time.time())
+    try:
+        total = write_snapshot(None, global_snapshot_pages(), generated_at, version)
+
+        removed = 0
+        with ThreadPoolExecutor(max_workers=max(1, WRITE_CONCURRENCY)) as pool:
+            for rows in pool.map(lambda store: publish_store_snapshot(store, generated_at, version), stores):
+                removed += not rows
+
+        logger.info(
+            "Snapshots publicados en s3://%s: %d items, %d tiendas (%d sin filas borradas) en %.2fs.",
+            SNAPSHOT_BUCKET, total, len(stores), removed, time.perf_counter() - started
+        )
+    except Exception as e:
+        logger.warning("No se pudieron publicar los snapshots del inventario: %s", e)
+
+def launch_snapshots(context, stores, version):
+    """
+    Lanza la publicación de snapshots en otra invocación: en la función
+    SNAPSHOT_FUNCTION_NAME (el mismo código con un timeout largo, porque el
+    Scan de toda la tabla no cabe en el de la carga) o, sin ella, en esta
+    misma. La carga ya está terminada y no espera por ella. 'version' es la
+    del inventario tras la carga (ver switch_snapshot).
+    """
+    if not SNAPSHOT_BUCKET:
+        return
+    try:
+        invoke_self(context, {'stores': sorted(stores), 'version': version}, 'snapshot_task',
+                    function_name=SNAPSHOT_FUNCTION_NAME or None)
+    except Exception as e:
+        logger.warning("No se pudo lanzar la publicación de snapshots: %s", e)
+
+def process_snapshot_task(task):
+    """Publica los snapshots y vuelve a subir la versión (invalida la caché de la API)."""
+    version = task.get('version')
+    if version is None:
+        # La carga no pudo subir la versión: vale la actual (no es menor que la suya)
+        version = inventory_version()
+    publish_snapshots(task.get('stores') or [], version)
+    bump_inventory_version()
+    return {'statusCode': 200, 'body': f"Snapshots publicados ({len(task.get('stores') or [])} tiendas)"}
+
+def seen_load_id(task):
+    """Carga a la que pertenece la tarea: el job del fan-out o la propia tarea."""
+    return task.get('job_id', task['task_id'])
+
+def seen_prefix(load_id):
+    return f"{SEEN_PREFIX}{quote(load_id, safe='')}/"
+
+def save_seen_keys(task, seen):
+    """
+    Sube las claves vistas en esta pasada (JSON Lines ordenadas, gzip). El
+    nombre depende de la tarea y la pasada: un reintento lo sobrescribe.
+    """
+    if not SNAPSHOT_BUCKET:
+        raise RuntimeError(
+            "El modo snapshot necesita SNAPSHOT_BUCKET para cargas en varias pasadas o rangos"
+        )
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as out:
+        for key in seen.seen_keys():
+            out.write((json.dumps(key, separators=(',', ':')) + '\n').encode('utf-8'))
+    name = f"{quote(task['task_id'], safe='')}-{task['passes']:05d}.jsonl.gz"
+    s3_client.put_object(Bucket=SNAPSHOT_BUCKET, Key=seen_prefix(seen_load_id(task)) + name, Body=buffer.getvalue())
+
+def read_seen_keys(key):
+    """Claves (tienda, Item) de un fichero de seen/, en el orden en que se guardaron."""
+    body = s3_client.get_object(Bucket=SNAPSHOT_BUCKET, Key=key)['Body']
+    for line in io.TextIOWrapper(gzip.GzipFile(fileobj=body, mode='rb'), encoding='utf-8'):
+        store, item = json.loads(line)
+        yield store, item
+
+def sweep_missing(load_id, after=None, should_stop=None):
+    """
+    Borrados del modo 'snapshot' de una carga repartida: mezcla las claves
+    vistas por todas las pasadas y rangos (cada fichero ya va ordenado) con
+    las filas de cada tienda, ordenadas por Item, y borra las que no están.
+    Empieza en la tienda 'after' (inclusive); repetir una tienda no cambia
+    nada. Devuelve (tienda por la que seguir o None, filas borradas).
+    """
+    files = []
+    for page in s3_client.get_paginator('list_objects_v2').paginate(
+            Bucket=SNAPSHOT_BUCKET, Prefix=seen_prefix(load_id)):
+        files += [obj['Key'] for obj in page.get('Contents', [])]
+    seen = heapq.merge(*(read_seen_keys(key) for key in files))
+
+    resume = None
+    writer = ParallelBatchWriter(TABLE_NAME)
+    with writer:
+        for store, keys in groupby(seen, key=lambda key: key[0]):
+            if after is not None and store < after:
+                continue
+            if should_stop and should_stop():
+                resume = store
+                break
+            wanted = (item for _, item in keys)
+            current = next(wanted, None)
+            for n, row in enumerate(store_rows(store, keys_only=True), 1):
+                while current is not None and current < row['Item']:
+                    current = next(wanted, None)
+                if current != row['Item']:
+                    writer.delete_item({'Store': shard_key(store, row['Item']), 'Item': row['Item']})
+                if should_stop and n % CHECKPOINT_CHECK_ROWS == 0 and should_stop():
+                    resume = store
+                    break
+            if resume is not None:
+                break
+    return resume, writer.report()['deleted'], files
+
+def launch_sweep(context, task):
+    """Lanza el barrido final del modo 'snapshot' en otra invocación."""
+    invoke_self(context, task, 'sweep_task')
+    logger.info("Carga %s terminada: barrido de las filas que faltan en otra invocación.", task['load_id'])
+
+def process_sweep_task(task, context):
+    """
+    Modo barrido: borra las filas que faltan en el fichero y termina la
+    carga (manifiesto, versión del inventario y snapshots). Si se acerca el
+    timeout continúa en otra invocación desde la tienda en curso.
+    """
+    should_stop = None
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        should_stop = lambda: context.get_remaining_time_in_millis() < CHECKPOINT_MARGIN_MS
+
+    resume, deleted, files = sweep_missing(task['load_id'], task.get('after'), should_stop)
+    task['deleted'] = task.get('deleted', 0) + deleted
+    if resume is not None:
+        task['after'] = resume
+        renew_claim(task.get('manifest'))
+        invoke_self(context, task, 'sweep_task')
+        logger.info("Barrido de %s: continúa en otra invocación desde la tienda %s.", task['load_id'], resume)
+        return {'statusCode': 202, 'body': f"Barrido de {task['load_id']}: continúa en otra invocación"}
+
+    for i in range(0, len(files), 1000):
+        s3_client.delete_objects(
+            Bucket=SNAPSHOT_BUCKET, Delete={'Objects': [{'Key': key} for key in files[i:i + 1000]]}
+        )
+    if 'job_id' in task:
+        state_table.update_item(
+            Key={'StateKey': f"job#{task['job_id']}"},
+            UpdateExpression="SET Deleted = :deleted",
+            ExpressionAttributeValues={':deleted': task['deleted']}
+        )
+    logger.info("Barrido de %s terminado: %d filas borradas.", task['load_id'], task['deleted'])
+    finish_upload(task.get('manifest'), 'DONE', rows=task['rows'])
+    launch_snapshots(context, task['stores'], bump_inventory_version())
+    return {'statusCode': 200, 'body': f"Barrido de {task['load_id']}: {task['deleted']} filas borradas"}
+
+def invoke_self(context, task, kind='range_task', function_name=None):
+    """Invoca de forma asíncrona otra copia de esta Lambda (o 'function_name') con una tarea."""
+    function_name = function_name or (
+        getattr(context, 'invoked_function_arn', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+    )
+    lambda_client.invoke(
+        FunctionName=function_name,
+        InvocationType='Event',
+        Payload=json.dumps({kind: task})
+    )
+
+def start_fanout(bucket_name, object_key, etag, size, context, job_id, manifest=None, fmt=('csv', None),
+                 version=None):
+    """
+    Modo coordinador: planifica los rangos, registra el trabajo en la tabla
+    de estado e invoca de forma asíncrona un worker por rango.
+    """
+    fieldnames, ranges = plan_ranges(bucket_name, object_key, etag, size, has_header=fmt[0] == 'csv')
+    if not ranges:
+        logger.warning("No se encontraron filas de datos en %s.", object_key)
+        return {'statusCode': 200, 'body': 'No se encontraron items válidos.'}
+    now = int(time.time())
+    state_table.put_item(Item={
+        'StateKey': f"job#{job_id}",
+        'Bucket': bucket_name,
+        'ObjectKey': object_key,
+        'ETag': etag,
+        'Size': size,
+        'RangesTotal': len(ranges),
+        'RowsWritten': 0,
+        'Skipped': 0,
+        'Duplicates': 0,
+        'Throttles': 0,
+        'Status': 'RUNNING',
+        'Manifest': manifest,
+        'StartedAt': now,
+        'ExpiresAt': now + STATE_TTL_SECONDS
+    })
+
+    for index, (start, end) in enumerate(ranges):
+        invoke_self(context, {
+            'task_id': f"{job_id}#{index}",
+            'job_id': job_id,
+            'index': index,
+            'bucket': bucket_name,
+            'key': object_key,
+            'etag': etag,
+            'start': start,
+            'end': end,
+            'fieldnames': fieldnames,
+            'format': list(fmt),
+            'manifest': manifest,
+            'version': version
+        })
+    logger.info(
+        "Fichero s3://%s/%s (%d bytes) repartido en %d rangos (job %s).",
+        bucket_name, object_key, size, len(ranges), job_id
+    )
+    return {
+        'statusCode': 202,
+        'body': f'Carga de {object_key} repartida en {len(ranges)} rangos (job {job_id})'
+    }
+
+def record_range_done(task, context):
+    """
+    Marca el rango como terminado (de forma idempotente) y, si es el último,
+    emite el resumen del trabajo completo.
+    """
+    expression = "ADD DoneRanges :idx, RowsWritten :rows, Skipped :skipped, Duplicates :dup, Throttles :thr"
+    values = {
+        ':idx': {task['index']},
+        ':i': task['index'],
+        ':rows': task['rows'],
+        ':skipped': task['skipped'],
+        ':dup': task['duplicates'],
+        ':thr': task['throttles']
+    }
+    if task['stores']:
+        # Un conjunto vacío no es un valor válido en DynamoDB
+        expression += ", TouchedStores :stores"
+        values[':stores'] = set(task['stores'])
+    try:
+        job = state_table.update_item(
+            Key={'StateKey': f"job#{task['job_id']}"},
+            UpdateExpression=expression,
+            ConditionExpression="attribute_exists(StateKey) AND NOT contains(DoneRanges, :i)",
+            ExpressionAttributeValues=values,
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            logger.warning("Rango %s del job %s ya estaba registrado.", task['index'], task['job_id'])
+            return
+        raise
+
+    if len(job.get('DoneRanges', ())) < job['RangesTotal']:
+        renew_claim(job.get('Manifest'))
+    else:
+        elapsed = max(1, int(time.time()) - int(job['StartedAt']))
+        state_table.update_item(
+            Key={'StateKey': f"job#{task['job_id']}"},
+            UpdateExpression="SET #s = :done, FinishedAt = :now",
+            ExpressionAttributeNames={'#s': 'Status'},
+            ExpressionAttributeValues={':done': 'COMPLETED', ':now': int(time.time())}
+        )
+        logger.info(
+            "Job %s completado: s3://%s/%s, %d rangos, %d items escritos y %d sin cambios "
+            "en ~%ds (%.1f filas/s, %d throttles).",
+            task['job_id'], job['Bucket'], job['ObjectKey'], job['RangesTotal'], job['RowsWritten'],
+            job.get('Skipped', 0), elapsed, job['RowsWritten'] / elapsed, job['Throttles']
+        )
+        if INGEST_MODE == INGEST_MODE_SNAPSHOT:
+            launch_sweep(context, {
+                'load_id': task['job_id'],
+                'job_id': task['job_id'],
+                'manifest': job.get('Manifest'),
+                'rows': int(job['RowsWritten']),
+                'deleted': int(job.get('Deleted', 0)),
+                'stores': sorted(job.get('TouchedStores', set()))
+            })
+        else:
+            finish_upload(job.get('Manifest'), 'DONE', rows=job['RowsWritten'])
+            launch_snapshots(context, job.get('TouchedStores', set()), bump_inventory_version())
+
+def load_checkpoint(task):
+    """Devuelve el checkpoint guardado de la tarea (o None)."""
+    response = state_table.get_item(Key={'StateKey': f"checkpoint#{task['task_id']}"}, ConsistentRead=True)
+    return response.get('Item')
+
+def save_checkpoint(task):
+    """
+    Guarda el offset y las filas escritas. Solo avanza: un reintento con
+    un offset anterior no pisa un checkpoint más reciente.
+    """
+    now = int(time.time())
+    counters = ", ".join(f"{attribute} = :{counter}" for counter, attribute in TASK_COUNTERS.items())
+    values = {f":{counter}": task[counter] for counter in TASK_COUNTERS}
+    values.update({
+        ':off': task['start'],
+        ':passes': task['passes'],
+        ':stores': task['stores'],
+        ':key': task['key'],
+        ':now': now,
+        ':exp': now + STATE_TTL_SECONDS
+    })
+    try:
+        state_table.update_item(
+            Key={'StateKey': f"checkpoint#{task['task_id']}"},
+            UpdateExpression=(
+                f"SET #off = :off, {counters}, Passes = :passes, TouchedStores = :stores, "
+                "ObjectKey = :key, UpdatedAt = :now, ExpiresAt = :exp"
+            ),
+            ConditionExpression="attribute_not_exists(#off) OR #off < :off",
+            ExpressionAttributeNames={'#off': 'Offset'},
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        logger.warning("Checkpoint de %s ya estaba más avanzado.", task['task_id'])
+
+def run_task(task, context):
+    """
+    Procesa una tarea (fichero completo o rango de bytes) vigilando el tiempo
+    restante. Si se acerca el timeout guarda un checkpoint y se re-invoca
+    para continuar desde esa posición sin reescribir lo ya cargado.
+    """
+    task.setdefault('start', 0)
+    task.setdefault('passes', 0)
+    task.setdefault('stores', [])
+    for counter in TASK_COUNTERS:
+        task.setdefault(counter, 0)
+
+    # Un reintento de la misma invocación retoma desde el último checkpoint
+    checkpoint = load_checkpoint(task)
+    if checkpoint and int(checkpoint['Offset']) > task['start']:
+        logger.info("Retomando %s desde el checkpoint (offset %s).", task['task_id'], checkpoint['Offset'])
+        task['start'] = int(checkpoint['Offset'])
+        task['passes'] = int(checkpoint.get('Passes', 0))
+        task['stores'] = list(checkpoint.get('TouchedStores', []))
+        for counter, attribute in TASK_COUNTERS.items():
+            task[counter] = int(checkpoint.get(attribute, 0))
+
+    should_stop = None
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        should_stop = lambda: context.get_remaining_time_in_millis() < CHECKPOINT_MARGIN_MS
+
+    # Modo 'snapshot': si esta invocación ve el fichero completo borra ella
+    # misma las filas que faltan. Si no (un rango o una continuación), guarda
+    # las claves vistas y el barrido final borra tras la última pasada. Un
+    # rango no lee la tienda entera: el coste queda acotado por el rango.
+    split = bool('job_id' in task or task['start'] or task['passes'])
+    snapshot = INGEST_MODE == INGEST_MODE_SNAPSHOT
+    whole = snapshot and not split
+
+    result = ingest_object(
+        task['bucket'], task['key'],
+        start=task['start'], end=task.get('end'),
+        fieldnames=task.get('fieldnames'), etag=task.get('etag'),
+        should_stop=should_stop, mode=INGEST_MODE, delete_missing=whole,
+        fmt=task.get('format', ('csv', None)), track_seen=snapshot, preload=not split,
+        version=task.get('version')
+    )
+    for counter in TASK_COUNTERS:
+        task[counter] += result[counter]
+        result[f'total_{counter}'] = task[counter]
+    # Tiendas de todas las pasadas (van en la tarea y en el checkpoint)
+    task['stores'] = sorted(result['stores'].union(task['stores']))
+    # Antes del checkpoint: una pasada registrada ya tiene sus claves en S3
+    seen = result.pop('seen')
+    sweep = seen is not None and not (whole and result['finished'])
+    if sweep:
+        save_seen_keys(task, seen)
+
+    if not result['finished']:
+        task.update({
+            'start': result['offset'],
+            'fieldnames': result['fieldnames'],
+            'etag': result['etag'],
+            'passes': task['passes'] + 1
+        })
+        save_checkpoint(task)
+        renew_claim(task.get('manifest'))
+        invoke_self(context, task)
+        logger.info(
+            "Tiempo casi agotado: %s continúa en otra invocación desde el offset %d (%d items hasta ahora).",
+            task['task_id'], task['start'], task['rows']
+        )
+        return result
+
+    if 'job_id' in task:
+        record_range_done(task, context)
+    elif sweep:
+        launch_sweep(context, {
+            'load_id': seen_load_id(task),
+            'manifest': task.get('manifest'),
+            'rows': task['rows'],
+            'deleted': task['deleted'],
+            'stores': task['stores']
+        })
+    else:
+        finish_upload(task.get('manifest'), 'DONE', rows=task['rows'])
+        launch_snapshots(context, task['stores'], bump_inventory_version())
+    return result
+
+def process_range_task(task, context):
+    """Modo worker: carga solo su rango de bytes (o continúa una carga)."""
+    logger.info(
+        "Procesando tarea %s [%d, %s).", task['task_id'], task.get('start', 0), task.get('end', 'EOF')
+    )
+    result = run_task(task, context)
+    if not result['finished']:
+        return {'statusCode': 202, 'body': f"Tarea {task['task_id']}: continúa en otra invocación"}
+    logger.info(
+        "Tarea %s terminada: %d items (%.1f filas/s en la última pasada).",
+        task['task_id'], result['total_rows'], result['rows_per_second']
+    )
+    return {'statusCode': 200, 'body': f"Tarea {task['task_id']}: {result['total_rows']} items"}
+
+def process_s3_record(record, task_id, context):
+    """
+    Procesa un objeto de un evento S3 y devuelve su resultado
+    ({'statusCode', 'body'}), igual que hacía el handler con un solo objeto.
+    """
+    # 1. Obtener el bucket y la clave (nombre del archivo) del registro S3
+    try:
+        s3_event = record['s3']
+        bucket_name = s3_event['bucket']['name']
+        object_key = unquote_plus(s3_event['object']['key'])
+        object_size = s3_event['object'].get('size')
+        object_etag = s3_event['object'].get('eTag')
+        # Identifica la subida (no solo el contenido): versionId o, sin versionado, el sequencer
+        object_version = s3_event['object'].get('versionId') or s3_event['object'].get('sequencer')
+    except (KeyError, TypeError) as e:
+        logger.error("Error al parsear el registro S3: %s", e)
+        return {'statusCode': 400, 'body': 'Registro S3 mal formado.'}
+
+    # 2. Deduplicación: el evento ya trae ETag y tamaño, así que una subida
+    # repetida se descarta sin leer el objeto. Los ficheros grandes
+    # necesitan un HEAD de todos modos para el modo coordinador.
+    manifest = None
+    fmt = None
+    try:
+        if object_size is None or object_etag is None or object_size >= FANOUT_MIN_BYTES:
+            head = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+            object_size, object_etag = head['ContentLength'], head['ETag']
+        object_etag = object_etag.strip('"')
+        if DEDUP_UPLOADS:
+            manifest = claim_upload(bucket_name, object_key, object_etag, object_size, task_id, object_version)
+            # Los deltas no se deduplican por contenido: subir dos veces los
+            # mismos deltas es sumarlos dos veces. Solo se descarta la misma
+            # subida (un reintento del evento), y aun así las marcas de
+            # delta_source impedirían volver a sumar.
+            if manifest is None and object_version:
+                fmt = detect_format(bucket_name, object_key)
+                if is_delta_object(bucket_name, object_key, f'"{object_etag}"', fmt):
+                    manifest = claim_upload(
+                        bucket_name, object_key, object_etag, object_size, task_id, object_version, per_upload=True
+                    )
+            if manifest is None:
+                logger.info("s3://%s/%s (ETag %s) ya fue ingerido. Se omite.", bucket_name, object_key, object_etag)
+                return {'statusCode': 200, 'body': f'{object_key} ya fue procesado con el mismo contenido.'}
+    except UploadInProgress as e:
+        # No es un duplicado terminado: si el otro intento se cae, hay que
+        # volver a cargarlo (desde SQS el mensaje vuelve a la cola)
+        logger.warning("%s. Se reintentará más tarde.", e)
+        return {'statusCode': 409, 'body': f'{object_key} se está cargando en otra invocación.'}
+    except ClientError as e:
+        logger.error("Error al consultar %s: %s", object_key, e)
+        return {'statusCode': 500, 'body': f'Error al leer {object_key} de {bucket_name}: {e}'}
+
+    # 3. Formato (CSV, JSON Lines, Parquet; opcionalmente gzip/zstd).
+    # Ficheros grandes de texto sin comprimir: modo coordinador (rangos en paralelo)
+    # Tras reclamar la subida, cualquier error la deja en FAILED para que un
+    # reintento pueda volver a reclamarla sin esperar al lease.
+    try:
+        fmt = fmt or detect_format(bucket_name, object_key)
+    except Exception as e:
+        logger.error("Error al detectar el formato de %s: %s", object_key, e)
+        finish_upload(manifest, 'FAILED')
+        return {'statusCode': 500, 'body': f'Error al leer {object_key} de {bucket_name}: {e}'}
+    if object_size >= FANOUT_MIN_BYTES and is_seekable_format(fmt):
+        if INGEST_MODE == INGEST_MODE_SNAPSHOT and not SNAPSHOT_BUCKET:
+            # Sin bucket no hay dónde juntar las claves de los rangos para el barrido
+            logger.error("Modo snapshot sin SNAPSHOT_BUCKET: no se puede repartir %s en rangos.", object_key)
+            finish_upload(manifest, 'FAILED')
+            return {'statusCode': 400, 'body': f'El modo snapshot necesita SNAPSHOT_BUCKET para {object_key} (fichero grande).'}
+        try:
+            return start_fanout(
+                bucket_name, object_key, f'"{object_etag}"', object_size, context, task_id, manifest, fmt,
+                object_version
+            )
+        except Exception as e:
+            logger.error("Error al repartir el objeto en rangos: %s", e)
+            finish_upload(manifest, 'FAILED')
+            return {'statusCode': 500, 'body': f'Error al repartir {object_key} de {bucket_name}: {e}'}
+
+    # 4. Parsear y cargar en DynamoDB a medida que llegan los datos.
+    # Si se acerca el timeout se continúa en otra invocación desde un checkpoint.
+    task = {
+        'task_id': task_id,
+        'bucket': bucket_name,
+        'key': object_key,
+        'format': fmt,
+        'manifest': manifest,
+        'version': object_version
+    }
+    try:
+        stats = run_task(task, context)
+    except UnicodeDecodeError as e:
+        logger.error("El fichero no es UTF-8 válido: %s", e)
+        finish_upload(manifest, 'FAILED')
+        return {'statusCode': 400, 'body': f'El archivo {object_key} no es UTF-8 válido.'}
+    except ClientError as e:
+        logger.error("Error de AWS al procesar %s: %s", object_key, e)
+        finish_upload(manifest, 'FAILED')
+        return {'statusCode': 500, 'body': f'Error al procesar {object_key} de {bucket_name}: {e}'}
+    except Exception as e:
+        logger.error("Error al escribir en DynamoDB: %s", e)
+        finish_upload(manifest, 'FAILED')
+        return {'statusCode': 500, 'body': f'Error al escribir en DynamoDB: {e}'}
+
+    if not stats['finished']:
+        return {
+            'statusCode': 202,
+            'body': f"Cargados {stats['total_rows']} items; la carga de {object_key} continúa en otra invocación"
+        }
+
+    items_written = stats['total_rows']
+    skipped, deleted = stats['total_skipped'], stats['total_deleted']
+    duplicates = stats['total_duplicates']
+    if not (items_written or skipped or deleted):
+        logger.warning("No se encontraron items válidos en el CSV.")
+        return {'statusCode': 200, 'body': 'No se encontraron items válidos.'}
+
+    logger.info(
+        "Carga exitosa (modo %s): %d items escritos, %d sin cambios, %d borrados y %d repetidos (%s) "
+        "en %.2fs (%.1f filas/s, %d throttles, %d hilos).",
+        INGEST_MODE, items_written, skipped, deleted, duplicates, DUPLICATE_KEY_POLICY, stats['seconds'],
+        stats['rows_per_second'], stats['total_throttles'], stats['concurrency']
+    )
+    return {
+        'statusCode': 200,
+        'body': (
+            f'Se cargaron {items_written} items en la tabla {TABLE_NAME} '
+            f'({skipped} sin cambios, {deleted} borrados, {duplicates} repetidos; '
+            f'{stats["rows_per_second"]} filas/s, {stats["total_throttles"]} throttles)'
+        )
+    }
+
+def process_s3_records(records, request_id, context):
+    """
+    Carga los objetos de una lista de registros S3 en paralelo y devuelve
+    un resultado por registro, en el mismo orden.
+    """
+    def process(indexed_record):
+        index, record = indexed_record
+        # Un fallo en un objeto no debe ocultar el resultado de los demás
+        try:
+            response = process_s3_record(record, f"{request_id}#{index}", context)
+        except Exception as e:
+            logger.error("Error inesperado procesando el registro %d: %s", index, e)
+            response = {'statusCode': 500, 'body': f'Error inesperado: {e}'}
+        s3_object = (record.get('s3') or {}).get('object') or {}
+        return {
+            'key': unquote_plus(s3_object.get('key', '')),
+            'statusCode': response['statusCode'],
+            'status': 'FAILED' if response['statusCode'] >= 400 else 'OK',
+            'message': response['body']
+        }
+
+    # Cliente S3 y recurso DynamoDB compartidos por todos los hilos
+    with ThreadPoolExecutor(max_workers=max(1, min(OBJECT_CONCURRENCY, len(records)))) as pool:
+        results = list(pool.map(process, enumerate(records)))
+    for r in results:
+        logger.info("Resultado %s: %s (%s) %s", r['key'], r['status'], r['statusCode'], r['message'])
+    return results
+
+def unwrap_sqs_records(messages):
+    """
+    Mensajes de SQS -> ([(messageId, registro S3)], [messageId ilegibles]).
+    Cada mensaje lleva en el cuerpo una notificación de S3 completa
+    ({"Records": [...]}); el s3:TestEvent que S3 manda al configurar la
+    cola no trae registros y se descarta.
+    """
+    s3_records = []
+    malformed = []
+    for message in messages:
+        try:
+            body = json.loads(message['body'])
+        except (KeyError, TypeError, ValueError):
+            body = None
+        if not isinstance(body, dict):
+            logger.error("Mensaje de SQS %s sin una notificación de S3 válida.", message.get('messageId'))
+            malformed.append(message.get('messageId'))
+            continue
+        for record in body.get('Records') or []:
+            s3_records.append((message['messageId'], record))
+    return s3_records, malformed
+
+def process_sqs_messages(messages, request_id, context):
+    """
+    Lote de la cola de subidas: carga todos los ficheros del lote (varios
+    pequeños por invocación) y devuelve en batchItemFailures los mensajes
+    con algún fichero fallido, para que SQS reintente solo esos (y tras
+    varios intentos los mande a la DLQ). Los mensajes repetidos de SQS los
+    descarta el manifiesto de subidas (DEDUP_UPLOADS) solo si la carga ya
+    terminó; si otra invocación viva la tiene reclamada (409) el mensaje
+    también se devuelve a la cola.
+    """
+    s3_records, failures = unwrap_sqs_records(messages)
+    results = process_s3_records([record for _, record in s3_records], request_id, context) if s3_records else []
+    failures += [
+        message_id for (message_id, _), result in zip(s3_records, results)
+        if result['status'] == 'FAILED'
+    ]
+    failures = list(dict.fromkeys(failures))
+    logger.info("Lote de SQS procesado: %d mensajes, %d objetos, %d mensajes con error.",
+                len(messages), len(results), len(failures))
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
+
+def lambda_handler(event, context):
+    """
+    Handler principal de la Lambda.
+    - Evento S3: carga cada fichero del evento (o lo reparte en rangos si es
+      grande). Los objetos independientes se procesan en paralelo.
+    - Evento SQS (cola de subidas opcional): igual, con los eventos S3 que
+      van dentro de cada mensaje; devuelve los mensajes fallidos
+      (ReportBatchItemFailures).
+    - Evento {'range_task': ...}: worker que carga un rango de bytes
+      o continúa una carga desde su último checkpoint.
+    - Evento {'sweep_task': ...}: barrido final del modo 'snapshot' en
+      cargas repartidas en rangos o pasadas.
+    - Evento {'snapshot_task': ...}: publica los snapshots tras una carga.
+    """
+    logger.info("Evento recibido: %s", event)
+
+    if 'range_task' in event:
+        # Los errores se propagan para que Lambda reintente la invocación asíncrona
+        return process_range_task(event['range_task'], context)
+    if 'sweep_task' in event:
+        return process_sweep_task(event['sweep_task'], context)
+    if 'snapshot_task' in event:
+        return process_snapshot_task(event['snapshot_task'])
+
+    records = event.get('Records') or []
+    if not records:
+        logger.error("Evento S3 sin registros.")
+        return {'statusCode': 400, 'body': 'Evento S3 mal formado.'}
+
+    request_id = getattr(context, 'aws_request_id', None) or str(int(time.time() * 1000))
+
+    if records[0].get('eventSource') == 'aws:sqs':
+        return process_sqs_messages(records, request_id, context)
+
+    results = process_s3_records(records, request_id, context)
+    failed = sum(1 for r in results if r['status'] == 'FAILED')
+    logger.info("Evento procesado: %d objetos, %d con error.", len(results), failed)
+
+    if not failed:
+        status_code = 200
+    elif failed == len(results):
+        status_code = max(r['statusCode'] for r in results)
+    else:
+        status_code = 207 # Resultado parcial
+    return {
+        'statusCode': status_code,
+        'body': json.dumps({'results': results, 'failed': failed}, ensure_ascii=False)
+    }
@@ -0,0 +1,42 @@
+# lambdas/shared/sharding.py
+# Claves repartidas de tiendas muy grandes, común a todas las lambdas.
+# package_lambda.py copia este fichero en la raíz de cada .zip, así que
+# cada lambda lo importa como 'sharding' sin duplicar el código.
+import os
+import zlib
+
+def parse_sharded_stores(value):
+    """'Berlin:8,Madrid:4' -> {'Berlin': 8, 'Madrid': 4} (se ignoran las de 1 partición)."""
+    stores = {}
+    for entry in value.split(','):
+        store, _, shards = entry.strip().rpartition(':')
+        if store and int(shards) > 1:
+            stores[store] = int(shards)
+    return stores
+
+# Tiendas con la clave repartida ('Berlin:8,Madrid:4'): sus filas se guardan
+# con Store = 'Berlin#<n>', n = crc32(Item) % 8, para no concentrar
+# escrituras y lecturas en una sola partición. Todas las lambdas leen la
+# misma variable SHARDED_STORES.
+SHARDED_STORES = parse_sharded_stores(os.environ.get('SHARDED_STORES', ''))
+
+def shard_key(store, item):
+    """Valor físico de Store para la fila (Store#n si la tienda está repartida)."""
+    shards = SHARDED_STORES.get(store)
+    if not shards:
+        return store
+    return f"{store}#{zlib.crc32(item.encode('utf-8')) % shards}"
+
+def store_partitions(store):
+    """Valores físicos de Store en los que están las filas de una tienda."""
+    shards = SHARDED_STORES.get(store)
+    if not shards:
+        return [store]
+    return [f"{store}#{n}" for n in range(shards)]
+
+def logical_store(store):
+    """Inverso de shard_key: 'Berlin#3' -> 'Berlin' (solo tiendas de SHARDED_STORES)."""
+    if not SHARDED_STORES or '#' not in store:
+        return store
+    base, _, shard = store.rpartition('#')
+    return base if base in SHARDED_STORES and shard.isdigit() else store
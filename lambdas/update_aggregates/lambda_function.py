@@ -0,0 +1,179 @@
+# lambdas/update_aggregates/lambda_function.py
+import os
+import json
+import hashlib
+import logging
+import boto3
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from sharding import logical_store # Los totales se guardan por tienda lógica
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb_client = boto3.client('dynamodb')
+TABLE_NAME = os.environ.get('DYNAMO_TABLE_NAME', 'Inventory')
+AGGREGATES_TABLE_NAME = os.environ.get('AGGREGATES_TABLE_NAME', 'InventoryAggregates')
+LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 5)) # El mismo umbral que notify_low_stock
+
+# Totales que se mantienen por tienda: SKUs, unidades y SKUs con bajo stock
+AGGREGATE_ATTRIBUTES = ('Skus', 'Units', 'LowStockSkus')
+# TransactWriteItems admite como mucho 100 acciones (una por tienda)
+TRANSACT_MAX_ITEMS = 100
+
+def image_totals(image):
+    """
+    Aporte de una imagen del stream (formato DynamoDB JSON) a los totales
+    de su tienda: (skus, unidades, skus con bajo stock). Sin imagen, ceros.
+    """
+    if not image:
+        return (0, Decimal(0), 0)
+    count = Decimal(image.get('Count', {}).get('N', '0'))
+    return (1, count, 1 if count < LOW_STOCK_THRESHOLD else 0)
+
+def record_delta(record):
+    """
+    Diferencia que provoca un registro del stream en los totales de su
+    tienda: imagen nueva menos imagen antigua (INSERT no tiene OldImage y
+    REMOVE no tiene NewImage). Devuelve (store, delta) o None si no cambia nada.
+    """
+    change = record.get('dynamodb', {})
+    store = change.get('Keys', {}).get('Store', {}).get('S')
+    if not store:
+        return None
+    new = image_totals(change.get('NewImage'))
+    old = image_totals(change.get('OldImage'))
+    delta = tuple(n - o for n, o in zip(new, old))
+    if not any(delta):
+        return None
+    return logical_store(store), delta
+
+def merge_deltas(records):
+    """Suma los deltas del lote por tienda: una sola actualización por tienda."""
+    totals = defaultdict(lambda: [0, Decimal(0), 0])
+    for record in records:
+        result = record_delta(record)
+        if result is None:
+            continue
+        store, delta = result
+        for i, value in enumerate(delta):
+            totals[store][i] += value
+    return {store: delta for store, delta in totals.items() if any(delta)}
+
+def batch_timestamp(records):
+    """Hora (ISO) del último cambio del lote, según el propio stream."""
+    seconds = max(
+        (float(r.get('dynamodb', {}).get('ApproximateCreationDateTime', 0)) for r in records),
+        default=0
+    )
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()
+
+def request_token(records, chunk_index):
+    """
+    ClientRequestToken de la transacción: derivado de los eventID del lote,
+    así un reintento del mismo lote (en los 10 minutos en que DynamoDB
+    recuerda el token) no vuelve a sumar los deltas.
+    """
+    digest = hashlib.sha256()
+    for record in records:
+        digest.update(record.get('eventID', '').encode('utf-8'))
+    digest.update(str(chunk_index).encode('utf-8'))
+    return digest.hexdigest()[:36]
+
+def apply_deltas(deltas, records):
+    """
+    Aplica los deltas con ADD atómico, en transacciones de hasta 100
+    tiendas: o se suman todas o ninguna, y si falla el lote entero se
+    reintenta sin haber sumado nada a medias.
+    """
+    updated_at = batch_timestamp(records)
+    stores = sorted(deltas)
+    for chunk_index, start in enumerate(range(0, len(stores), TRANSACT_MAX_ITEMS)):
+        actions = []
+        for store in stores[start:start + TRANSACT_MAX_ITEMS]:
+            skus, units, low = deltas[store]
+            actions.append({'Update': {
+                'TableName': AGGREGATES_TABLE_NAME,
+                'Key': {'Store': {'S': store}},
+                'UpdateExpression': 'ADD Skus :skus, Units :units, LowStockSkus :low SET UpdatedAt = :now',
+                'ExpressionAttributeValues': {
+                    ':skus': {'N': str(skus)},
+                    ':units': {'N': str(units)},
+                    ':low': {'N': str(low)},
+                    ':now': {'S': updated_at}
+                }
+            }})
+        dynamodb_client.transact_write_items(
+            TransactItems=actions,
+            ClientRequestToken=request_token(records, chunk_index)
+        )
+
+def rebuild():
+    """
+    Recalcula los totales desde cero recorriendo la tabla de inventario
+    (para tablas que ya tenían datos antes de crear el consumidor del
+    stream, o para corregir desvíos). Sobrescribe cada tienda y borra las
+    que ya no tienen artículos. Conviene lanzarlo sin cargas en curso.
+    """
+    totals = defaultdict(lambda: [0, Decimal(0), 0])
+    kwargs = {
+        'TableName': TABLE_NAME,
+        'ProjectionExpression': '#s, #c',
+        'ExpressionAttributeNames': {'#s': 'Store', '#c': 'Count'}
+    }
+    while True:
+        response = dynamodb_client.scan(**kwargs)
+        for item in response.get('Items', []):
+            for i, value in enumerate(image_totals(item)):
+                totals[logical_store(item['Store']['S'])][i] += value
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    now = datetime.now(timezone.utc).isoformat()
+    for store, (skus, units, low) in totals.items():
+        dynamodb_client.put_item(
+            TableName=AGGREGATES_TABLE_NAME,
+            Item={
+                'Store': {'S': store},
+                'Skus': {'N': str(skus)},
+                'Units': {'N': str(units)},
+                'LowStockSkus': {'N': str(low)},
+                'UpdatedAt': {'S': now}
+            }
+        )
+
+    removed = 0
+    paginator = dynamodb_client.get_paginator('scan')
+    for page in paginator.paginate(TableName=AGGREGATES_TABLE_NAME, ProjectionExpression='#s',
+                                   ExpressionAttributeNames={'#s': 'Store'}):
+        for item in page.get('Items', []):
+            if item['Store']['S'] not in totals:
+                dynamodb_client.delete_item(TableName=AGGREGATES_TABLE_NAME, Key={'Store': item['Store']})
+                removed += 1
+
+    logger.info("Agregados recalculados: %d tiendas, %d borradas", len(totals), removed)
+    return {'statusCode': 200, 'body': json.dumps({'stores': len(totals), 'removed': removed})}
+
+def lambda_handler(event, context):
+    """
+    Handler principal de la Lambda.
+    Se dispara por el Stream de DynamoDB de la tabla de inventario
+    (NEW_AND_OLD_IMAGES) y mantiene los totales por tienda en la tabla de
+    agregados. Invocada con {"rebuild": true} recalcula todo desde la tabla.
+    """
+    if event.get('rebuild'):
+        return rebuild()
+
+    records = event.get('Records', [])
+    deltas = merge_deltas(records)
+    if deltas:
+        # Si falla, se propaga la excepción: Lambda reintenta el lote entero
+        apply_deltas(deltas, records)
+    logger.info("Lote de %d registros: %d tiendas actualizadas", len(records), len(deltas))
+
+    return {
+        'statusCode': 200,
+        'body': f'Tiendas actualizadas: {len(deltas)}'
+    }